@@ -4,28 +4,111 @@ from CommonContent import SimpleMeleeAttack
 from Level import BUFF_TYPE_CURSE, STACK_NONE
 from Monsters import MordredCorruption
 
+from mods.Cradle.Util import add_level_hook, get_object_pool
+
+import weakref
+import numpy as np
+
 pure_desc = "Purified units cannot use abilities unless they deal physical damage."
 mana_cloud_desc = ("Mana clouds apply [purified] to units each turn. Purified "
                     "units cannot use abilities unless they deal physical damage.")
 
+_unaffected_kinds = {}
+
 def pure_unaffected(spell):
-    if hasattr(spell, 'damage_type') and spell.damage_type == Tags.Physical:
-        return True
-    
-    if isinstance(spell, MordredCorruption):
-        return True
-    
-    return False
+    # The answer only depends on the spell's class and damage type, so it is worked out once per pair
+    key = (type(spell), getattr(spell, 'damage_type', None))
+    unaffected = _unaffected_kinds.get(key)
+
+    if unaffected is None:
+        unaffected = key[1] == Tags.Physical or isinstance(spell, MordredCorruption)
+        _unaffected_kinds[key] = unaffected
+
+    return unaffected
+
+def get_affected_spells(unit):
+    return [spell for spell in unit.spells if not pure_unaffected(spell)]
+
+def deny_cooldowns(unit, spells = None):
+    if spells is None:
+        spells = get_affected_spells(unit)
+
+    cool_downs = unit.cool_downs
+    cool_downs.update({spell: 2 for spell in spells if cool_downs.get(spell, 0) < 2})
+
+class PurifiedRegistry:
+    """
+    The units in a level that currently have PureBuff.
+    Kept up to date by PureBuff itself, so membership tests don't need to scan a unit's buffs.
+    Iterating yields them in level.units order, the same order a scan of the level would.
+    """
+    def __init__(self, level):
+        self.level = level
+        self.units = set()
+
+        for unit in level.units:
+            if unit.has_buff(PureBuff):
+                self.add(unit)
+
+    def add(self, unit):
+        self.units.add(unit)
 
-def deny_cooldowns(unit):
-    for spell in unit.spells:
-        if pure_unaffected(spell):
-            continue
+    def remove(self, unit):
+        self.units.discard(unit)
 
-        current_cooldown = unit.cool_downs.get(spell, 0)
-        unit.cool_downs[spell] = max(2, current_cooldown)
+    def __contains__(self, unit):
+        return unit in self.units
+
+    def __len__(self):
+        return len(self.units)
+
+    def __iter__(self):
+        if not self.units:
+            return
+
+        for unit in [unit for unit in self.units if not unit.is_alive()]:
+            self.remove(unit)
+
+        # Membership is checked as each unit is reached, so units unpurified mid-iteration are skipped
+        for unit in self.level.units:
+            if unit in self.units:
+                yield unit
+
+    def hostiles(self, unit):
+        for purified in self:
+            if are_hostile(purified, unit):
+                yield purified
+
+_purified_registries = weakref.WeakKeyDictionary()
+
+def get_purified(level):
+    registry = _purified_registries.get(level)
+    if registry is None:
+        registry = PurifiedRegistry(level)
+        _purified_registries[level] = registry
+
+    return registry
+
+def is_purified(unit):
+    if getattr(unit, "level", None) is None:
+        return unit.has_buff(PureBuff)
+
+    return unit in get_purified(unit.level)
 
 class PureCloud(Cloud):
+    """
+    A mana cloud. Once placed in a level, its duration, owner and healing live in the level's ManaCloudField.
+    It still advances on its own, in the engine's cloud order.
+    """
+    field = None
+
+    # Shared by every mana cloud
+    cloud_asset_name = "../../../mods/Cradle/assets/clouds/mana_cloud"
+    cloud_color = Color(180, 220, 255)
+    cloud_name = "Mana Cloud"
+    cloud_description = ("Each turn, any unit standing inside is purified.\n"
+                         + pure_desc)
+
     def __init__(self, owner, duration, healing = 0):
         Cloud.__init__(self)
 
@@ -33,43 +116,325 @@ class PureCloud(Cloud):
         self.owner = owner
         self.healing = healing
 
-        self.asset_name = "../../../mods/Cradle/assets/clouds/mana_cloud"
+        self.asset_name = self.cloud_asset_name
 
-        self.color = Color(180, 220, 255)
-        self.name = "Mana Cloud"
-        self.description = ("Each turn, any unit standing inside is purified.\n"
-                            + pure_desc)
+        self.color = self.cloud_color
+        self.name = self.cloud_name
+        self.description = self.cloud_description
 
-    def on_advance(self):
-        unit = self.level.get_unit_at(self.x, self.y)
+    @property
+    def duration(self):
+        if self.field is not None:
+            return int(self.field.duration[self.x, self.y])
+        return self._duration
 
-        if unit is None:
-            return
+    @duration.setter
+    def duration(self, value):
+        if self.field is not None:
+            self.field.duration[self.x, self.y] = value
+        else:
+            self._duration = value
+
+    @property
+    def healing(self):
+        if self.field is not None:
+            return int(self.field.healing[self.x, self.y])
+        return self._healing
+
+    @healing.setter
+    def healing(self, value):
+        if self.field is not None:
+            self.field.healing[self.x, self.y] = value
+        else:
+            self._healing = value
+
+    @property
+    def owner(self):
+        if self.field is not None:
+            return self.field.get_owner(self.x, self.y)
+        return self._owner
+
+    @owner.setter
+    def owner(self, value):
+        if self.field is not None:
+            self.field.set_owner(self.x, self.y, value)
+        else:
+            self._owner = value
+
+    def __getstate__(self):
+        # The field isn't saved with the level, so store the cloud's own values instead
+        state = self.__dict__.copy()
+        state.pop("field", None)
+        state["_duration"] = self.duration
+        state["_healing"] = self.healing
+        state["_owner"] = self.owner
+        return state
 
+    def affect(self, unit):
         if unit == self.owner:
             return
         
-        if unit.has_buff(PureBuff):
+        if is_purified(unit):
             return
 
         if self.healing > 0 and not are_hostile(unit, self.owner):
             unit.deal_damage(-self.healing, Tags.Heal, self)
             self.kill()
         else:
-            unit.apply_buff(PureBuff(), 2)
+            purify(unit, 2)
+
+    def on_advance(self):
+        unit = self.level.get_unit_at(self.x, self.y)
+
+        if unit is None:
+            return
+
+        self.affect(unit)
+
+class ManaCloudField:
+    """
+    Remaining duration, owner and healing of every mana cloud in a level, stored as arrays indexed by [x, y].
+    occupied marks the tiles that have a mana cloud.
+    """
+    def __init__(self, level):
+        self.level = level
+
+        self.duration = np.zeros((level.width, level.height), dtype=np.int32)
+        self.healing = np.zeros((level.width, level.height), dtype=np.int32)
+        self.owner = np.full((level.width, level.height), -1, dtype=np.int32)
+        self.occupied = np.zeros((level.width, level.height), dtype=bool)
+
+        self.owners = []
+        self.owner_indices = {}
+
+        self.clouds = {}
+
+        for cloud in level.clouds:
+            if isinstance(cloud, PureCloud) and cloud.field is None:
+                self.add(cloud)
+
+    def get_owner(self, x, y):
+        index = self.owner[x, y]
+        return self.owners[index] if index >= 0 else None
+
+    def set_owner(self, x, y, owner):
+        if owner is None:
+            self.owner[x, y] = -1
+            return
+
+        if owner not in self.owner_indices:
+            self.owner_indices[owner] = len(self.owners)
+            self.owners.append(owner)
+
+        self.owner[x, y] = self.owner_indices[owner]
+
+    def add(self, cloud):
+        x, y = cloud.x, cloud.y
+
+        if (x, y) in self.clouds:
+            self.remove(self.clouds[(x, y)])
+
+        self.clouds[(x, y)] = cloud
+        self.duration[x, y] = cloud._duration
+        self.healing[x, y] = cloud._healing
+        self.set_owner(x, y, cloud._owner)
+        self.occupied[x, y] = True
+
+        cloud.field = self
+
+    def remove(self, cloud):
+        x, y = cloud.x, cloud.y
+        if self.clouds.get((x, y)) is not cloud:
+            return
+
+        cloud._duration = int(self.duration[x, y])
+        cloud._healing = int(self.healing[x, y])
+        cloud._owner = self.get_owner(x, y)
+        cloud.field = None
+
+        del self.clouds[(x, y)]
+        self.duration[x, y] = 0
+        self.healing[x, y] = 0
+        self.owner[x, y] = -1
+        self.occupied[x, y] = False
+
+_mana_cloud_fields = weakref.WeakKeyDictionary()
+
+def get_mana_clouds(level):
+    field = _mana_cloud_fields.get(level)
+    if field is None:
+        field = ManaCloudField(level)
+        _mana_cloud_fields[level] = field
+
+    return field
+
+# What a cloud placement does when its tile already has a cloud
+CLOUD_KEEP = "keep"
+CLOUD_REPLACE = "replace"
+CLOUD_REPLACE_OTHER = "replace_other"
+
+class CloudPlacements:
+    """
+    Mana clouds waiting to be placed in a level, at most one per tile.
+    Spawners add clouds along with the rule they use for tiles that already have a cloud, then commit them all at once.
+
+    CLOUD_KEEP: leave any existing cloud alone.
+    CLOUD_REPLACE: kill any existing cloud.
+    CLOUD_REPLACE_OTHER: leave existing mana clouds alone, kill any other cloud.
+    """
+    def __init__(self, level):
+        self.level = level
+        self.pending = {}
+
+    def blocked(self, cloud, rule):
+        if cloud is None:
+            return False
+        if rule == CLOUD_KEEP:
+            return True
+        if rule == CLOUD_REPLACE_OTHER:
+            return isinstance(cloud, PureCloud)
+        return False
+
+    def add(self, x, y, owner, duration, healing = 0, rule = CLOUD_REPLACE) -> bool:
+        """
+        Returns whether the cloud will be placed.
+        A cloud waiting on the same tile counts as an existing mana cloud.
+        """
+        if (x, y) in self.pending:
+            if rule != CLOUD_REPLACE:
+                return False
+        elif self.blocked(self.level.tiles[x][y].cloud, rule):
+            return False
+
+        self.pending[(x, y)] = (owner, duration, healing, rule)
+        return True
+
+    def cancel(self, x, y) -> bool:
+        """
+        Drops the cloud waiting on the tile, if any, and returns whether there was one.
+        """
+        return self.pending.pop((x, y), None) is not None
+
+    def get_blocked(self):
+        """
+        Returns a grid of the tiles that have a mana cloud or one waiting to be placed, indexed by [x, y].
+        """
+        blocked = get_mana_clouds(self.level).occupied.copy()
+        for x, y in self.pending:
+            blocked[x, y] = True
+
+        return blocked
+
+    def commit(self):
+        pending = self.pending
+        self.pending = {}
+
+        for (x, y), (owner, duration, healing, rule) in pending.items():
+            tile = self.level.tiles[x][y]
+            if self.blocked(tile.cloud, rule):
+                continue
+            if tile.cloud is not None:
+                tile.cloud.kill()
+
+            self.level.add_obj(make_pure_cloud(self.level, owner, duration, healing), x, y)
+
+_cloud_placements = weakref.WeakKeyDictionary()
+
+def get_cloud_placements(level) -> CloudPlacements:
+    placements = _cloud_placements.get(level)
+    if placements is None:
+        placements = CloudPlacements(level)
+        _cloud_placements[level] = placements
+
+    return placements
+
+def _on_obj_added(level, obj, x, y, *args, **kwargs):
+    if not isinstance(obj, PureCloud):
+        return
+    if level.tiles[x][y].cloud is not obj:
+        return
+
+    field = get_mana_clouds(level)
+    if obj.field is None:
+        field.add(obj)
+
+def _on_obj_removed(level, obj, *args, **kwargs):
+    if not isinstance(obj, PureCloud):
+        return
+    if obj.field is None:
+        return
+
+    obj.field.remove(obj)
+
+    # Only clouds that were really in the level are reused, and only once
+    if obj.field is None:
+        get_object_pool(level, PureCloud).release(obj)
+
+add_level_hook("add_obj", _on_obj_added)
+add_level_hook("remove_obj", _on_obj_removed)
 
 class PureBuff(Buff):
+    buff_name = "Purified"
+    buff_description = "Overwhelmed by pure mana. Cannot use abilities."
+
     def __init__(self):
         Buff.__init__(self)
 
-        self.name = "Purified"
-        self.description = "Overwhelmed by pure mana. Cannot use abilities."
+        self.name = self.buff_name
+        self.description = self.buff_description
 
         self.buff_type = BUFF_TYPE_CURSE
         self.stack_type = STACK_NONE
 
     def on_applied(self, owner):
-        deny_cooldowns(owner)
+        if getattr(owner, "level", None) is not None:
+            get_purified(owner.level).add(owner)
+
+        self.update_affected_spells(owner)
+        deny_cooldowns(owner, self.affected_spells)
+
+    # Only redone if the unit gains or loses spells while purified
+    def update_affected_spells(self, owner):
+        self.affected_spells = get_affected_spells(owner)
+        self.spell_count = len(owner.spells)
+
+    def on_unapplied(self):
+        if getattr(self.owner, "level", None) is not None:
+            get_purified(self.owner.level).remove(self.owner)
+            get_object_pool(self.owner.level, PureBuff).release(self)
 
     def on_advance(self):
-        deny_cooldowns(self.owner)
\ No newline at end of file
+        if getattr(self, "spell_count", None) != len(self.owner.spells):
+            self.update_affected_spells(self.owner)
+
+        deny_cooldowns(self.owner, self.affected_spells)
+
+def make_pure_cloud(level, owner, duration, healing = 0) -> PureCloud:
+    """
+    Returns a mana cloud to add to the level, reusing one that expired if there is one.
+    """
+    cloud = get_object_pool(level, PureCloud).take()
+    if cloud is None:
+        return PureCloud(owner, duration, healing)
+
+    PureCloud.__init__(cloud, owner, duration, healing)
+    cloud.killed = False
+    return cloud
+
+def purify(unit, duration):
+    """
+    Applies PureBuff to the unit, reusing a buff that was removed if there is one.
+    If the unit is already purified the buff goes straight back to the pool.
+    """
+    pool = get_object_pool(unit.level, PureBuff)
+
+    buff = pool.take()
+    if buff is None:
+        buff = PureBuff()
+    else:
+        PureBuff.__init__(buff)
+
+    unit.apply_buff(buff, duration)
+
+    if getattr(buff, "owner", None) is not unit:
+        pool.release(buff)
@@ -1,12 +1,18 @@
 from mods.API_TileHazards.API_TileHazards import TileHazardBasic
-from Level import Tags
+from Level import Tags, Point
+
+from mods.Cradle.Util import deal_damages, add_level_hook, get_object_pool
 
 class FrozenManaHazard(TileHazardBasic):
+    # Shared by every spike
+    hazard_asset = ["Cradle", "assets", "tilehazards", "frozen_mana"]
+
     def __init__(self, user, source, duration, damage):
         TileHazardBasic.__init__(self, "Frozen Mana", duration, user)
         self.damage = damage
         self.source = source
-        self.asset = ["Cradle", "assets", "tilehazards", "frozen_mana"]
+        self.asset = self.hazard_asset
+        self.pooled = False
 
     def effect(self, unit):
         pass
@@ -14,5 +20,24 @@ class FrozenManaHazard(TileHazardBasic):
     def advance_effect(self):
         unit = self.user.level.get_unit_at(self.x, self.y)
         if unit is not None:
-            self.user.level.deal_damage(self.x, self.y, self.damage, Tags.Ice, self.source)
-            self.user.level.deal_damage(self.x, self.y, self.damage, Tags.Pure, self.source)
\ No newline at end of file
+            deal_damages(self.user.level, Point(self.x, self.y), [(self.damage, Tags.Ice), (self.damage, Tags.Pure)], self.source)
+
+def make_frozen_mana(level, user, source, duration, damage) -> FrozenManaHazard:
+    """
+    Returns a frozen mana spike to add to the level, reusing one that expired if there is one.
+    """
+    hazard = get_object_pool(level, FrozenManaHazard).take()
+    if hazard is None:
+        return FrozenManaHazard(user, source, duration, damage)
+
+    FrozenManaHazard.__init__(hazard, user, source, duration, damage)
+    return hazard
+
+def _on_obj_removed(level, obj, *args, **kwargs):
+    if not isinstance(obj, FrozenManaHazard) or obj.pooled:
+        return
+
+    obj.pooled = True
+    get_object_pool(level, FrozenManaHazard).release(obj)
+
+add_level_hook("remove_obj", _on_obj_removed)
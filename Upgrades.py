@@ -1,14 +1,107 @@
 from tkinter import E
-from Level import EventOnUnitAdded, are_hostile, Tags, Burst, Point, Spell, Unit
-from Level import EventOnDamaged, EventOnBuffApply, EventOnBuffRemove, EventOnSpellCast
+from Level import EventOnUnitAdded, are_hostile, Tags, Point, Spell, Unit
+from Level import EventOnBuffApply, EventOnBuffRemove, EventOnSpellCast
 from CommonContent import Poison
 from Upgrades import Upgrade, skill_constructors
 
-from mods.Cradle.Pure import PureBuff, PureCloud, mana_cloud_desc
-from mods.Cradle.Tilehazards import FrozenManaHazard
-from mods.Cradle.Util import has_adjacent_chasm
+from mods.Cradle.Pure import PureBuff, PureCloud, mana_cloud_desc, get_purified, is_purified, get_cloud_placements, CLOUD_KEEP
+from mods.Cradle.Tilehazards import make_frozen_mana
+from mods.Cradle.Util import get_terrain_grids, get_burst, get_units_in_los, get_damage_dispatcher, get_chain_reactions, deal_damages, deal_area_damage
+
+import weakref
+
+class DamageTriggerUpgrade(Upgrade):
+    """
+    An upgrade that reacts to damage through the level's damage dispatcher instead of a global EventOnDamaged trigger.
+    Triggers are added in on_init with add_damage_trigger.
+    """
+    def __init__(self):
+        self.damage_triggers = []
+        Upgrade.__init__(self)
+
+    def add_damage_trigger(self, damage_type, handler, hostile = False, own_source = False):
+        """
+        hostile: only call the handler when the damaged unit is hostile to the owner.
+        own_source: only call the handler when the owner is the owner of the damage source.
+        """
+        self.damage_triggers.append((damage_type, handler, hostile, own_source))
+
+    def subscribe(self):
+        Upgrade.subscribe(self)
+
+        dispatcher = get_damage_dispatcher(self.owner.level)
+        for damage_type, handler, hostile, own_source in self.damage_triggers:
+            dispatcher.subscribe(damage_type, handler, self.owner if hostile else None, self.owner if own_source else None)
+
+    def unsubscribe(self):
+        Upgrade.unsubscribe(self)
+
+        dispatcher = get_damage_dispatcher(self.owner.level)
+        for damage_type, handler, hostile, own_source in self.damage_triggers:
+            dispatcher.unsubscribe(damage_type, handler, self.owner if own_source else None)
+
+class TurnSnapshot:
+    """
+    What the Cradle upgrades check each turn, gathered in one pass over the level's units.
+    Lists are in level.units order. Purified units aren't copied, since the level's PurifiedRegistry is already kept live.
+    Units can die or lose buffs after the snapshot is taken, so check them before acting on one.
+    """
+    def __init__(self, owner):
+        level = owner.level
+        self.owner = owner
+        self.turn = level.turn_no
+
+        self.hostiles = []
+        self.holy_allies = []
+        self.undead_allies = []
+        self.poisoned = set()
+
+        # Units on a chasm map to True, units next to one to False
+        self.chasm = {}
+
+        grids = get_terrain_grids(level)
+        for unit in level.units:
+            if are_hostile(owner, unit):
+                self.hostiles.append(unit)
+            else:
+                if Tags.Holy in unit.tags:
+                    self.holy_allies.append(unit)
+                if Tags.Undead in unit.tags:
+                    self.undead_allies.append(unit)
+
+            if unit.has_buff(Poison):
+                self.poisoned.add(unit)
+
+            if grids.chasm[unit.x, unit.y]:
+                self.chasm[unit] = True
+            elif grids.adjacent_chasm[unit.x, unit.y]:
+                self.chasm[unit] = False
+
+_turn_snapshots = weakref.WeakKeyDictionary()
+
+def get_turn_snapshot(owner) -> TurnSnapshot:
+    """
+    Returns the snapshot of owner's level for the current turn, taking it if no upgrade has yet this turn.
+    """
+    snapshot = _turn_snapshots.get(owner.level)
+    if snapshot is None or snapshot.turn != owner.level.turn_no or snapshot.owner is not owner:
+        snapshot = TurnSnapshot(owner)
+        _turn_snapshots[owner.level] = snapshot
+
+    return snapshot
+
+class SnapshotUpgrade(Upgrade):
+    """
+    An upgrade that acts each turn on the shared TurnSnapshot instead of scanning the level's units itself.
+    Subclasses implement on_tick.
+    """
+    def on_advance(self):
+        self.on_tick(get_turn_snapshot(self.owner))
+
+    def on_tick(self, snapshot):
+        pass
 
-class CleansingFlame(Upgrade):
+class CleansingFlame(DamageTriggerUpgrade):
     def on_init(self):
         self.name = "Cleansing Flame"
         self.level = 4
@@ -19,24 +112,33 @@ class CleansingFlame(Upgrade):
         self.damage = 6
         self.radius = 2
 
-        self.global_triggers[EventOnDamaged] = self.on_damage
+        self.add_damage_trigger(Tags.Fire, self.on_damage, hostile=True)
     
     def get_description(self):
         return ("[Purified:pure] enemies explode in a [{radius}_tile:radius] burst for [{damage}_fire:fire] damage "
                 "upon taking any fire damage.\n"
                 "[Purified:pure] is removed from the enemy.").format(**self.fmt_dict())
     
+    # Explosions that set off other explosions are queued rather than run from inside this handler
     def on_damage(self, evt):
-        if not are_hostile(evt.unit, self.owner):
-            return
-        
-        if evt.damage_type == Tags.Fire and evt.unit.has_buff(PureBuff):
+        if is_purified(evt.unit):
             evt.unit.remove_buffs(PureBuff)
-            for stage in Burst(self.owner.level, Point(evt.unit.x, evt.unit.y), self.radius):
-                for point in stage:
-                    self.owner.level.deal_damage(point.x, point.y, self.get_stat("damage"), Tags.Fire, self)
+            get_chain_reactions(self.owner.level).push((self, evt.unit), self.explode, evt.unit, Point(evt.unit.x, evt.unit.y), self.owner.level.turn_no)
+
+    def explode(self, unit, origin, turn):
+        # An explosion left over for a later turn goes off wherever the unit is now, or not at all if it died
+        if turn != self.owner.level.turn_no:
+            if not unit.is_alive():
+                return
+            origin = Point(unit.x, unit.y)
+
+        for stage in get_burst(self.owner.level, origin, self.radius):
+            deal_area_damage(self.owner.level, stage, self.get_stat("damage"), Tags.Fire, self)
 
-class SpiritCorruption(Upgrade):
+    def on_advance(self):
+        get_chain_reactions(self.owner.level).drain()
+
+class SpiritCorruption(SnapshotUpgrade):
     def on_init(self):
         self.name = "Spirit Corruption"
         self.level = 4
@@ -50,18 +152,16 @@ class SpiritCorruption(Upgrade):
         return ("Enemies that are both [purified] and [poisoned] take [{damage}_pure:pure] and [{damage}_poison:poison] damage "
                 "for each ability they have.").format(**self.fmt_dict())
     
-    def on_advance(self):
-        for unit in self.owner.level.units:
-            if not are_hostile(unit, self.owner):
-                continue
-            if not (unit.has_buff(PureBuff) and unit.has_buff(Poison)):
+    # Purified units are taken from the live registry, in level.units order, so cleansing or killing one mid-turn is seen
+    def on_tick(self, snapshot):
+        for unit in get_purified(self.owner.level).hostiles(self.owner):
+            if unit not in snapshot.poisoned:
                 continue
 
             damage = self.get_stat("damage") * len(unit.spells)
-            unit.deal_damage(damage, Tags.Pure, self)
-            unit.deal_damage(damage, Tags.Poison, self)
+            deal_damages(self.owner.level, unit, [(damage, Tags.Pure), (damage, Tags.Poison)], self)
 
-class FrozenMana(Upgrade):
+class FrozenMana(DamageTriggerUpgrade):
     def on_init(self):
         self.name = "Frozen Mana"
         self.level = 4
@@ -73,7 +173,7 @@ class FrozenMana(Upgrade):
         self.duration = 7
 
         self.owner_triggers[EventOnSpellCast] = self.on_spell_cast
-        self.global_triggers[EventOnDamaged] = self.on_damage
+        self.add_damage_trigger(Tags.Ice, self.on_damage, hostile=True)
     
     def get_description(self):
         return ("Your [ice] spells leave behind frozen mana spikes when impacting "
@@ -83,7 +183,7 @@ class FrozenMana(Upgrade):
                 "standing on them each turn.").format(**self.fmt_dict())
     
     def add_frozen_mana(self, x, y):
-        mana = FrozenManaHazard(self.owner, self, self.get_stat("duration"), self.get_stat("damage"))
+        mana = make_frozen_mana(self.owner.level, self.owner, self, self.get_stat("duration"), self.get_stat("damage"))
         self.owner.level.add_obj(mana, x, y)
 
     def handle_ice(self, x, y):
@@ -99,19 +199,17 @@ class FrozenMana(Upgrade):
             self.add_frozen_mana(tile.x, tile.y)
             return
 
+        # A mana cloud that hasn't been placed yet freezes the same way
+        if get_cloud_placements(self.owner.level).cancel(tile.x, tile.y):
+            self.add_frozen_mana(tile.x, tile.y)
+            return
+
         unit = self.owner.level.get_unit_at(tile.x, tile.y)
 
-        if unit is not None and unit.has_buff(PureBuff):
+        if unit is not None and is_purified(unit):
             self.add_frozen_mana(tile.x, tile.y)
 
     def on_damage(self, evt):
-        if evt.damage_type != Tags.Ice:
-            return
-        if not evt.unit:
-            return
-        if not are_hostile(self.owner, evt.unit):
-            return
-        
         self.handle_ice(evt.unit.x, evt.unit.y)
 
     def on_spell_cast(self, evt):
@@ -127,7 +225,7 @@ class FrozenMana(Upgrade):
         for point in points:
             self.handle_ice(point.x, point.y)
 
-class Nihilism(Upgrade):
+class Nihilism(SnapshotUpgrade):
     def on_init(self):
         self.name = "Nihilism"
         self.level = 4
@@ -141,21 +239,17 @@ class Nihilism(Upgrade):
         return ("[Purified:pure] enemies standing next to a chasm take [{damage}_pure:pure] and [{damage}_arcane:arcane] damage each turn.\n"
                 "Enemies flying above a chasm take double this damage.").format(**self.fmt_dict())
 
-    def on_advance(self):
-        for unit in self.owner.level.units:
-            if not are_hostile(unit, self.owner):
+    def on_tick(self, snapshot):
+        for unit in snapshot.hostiles:
+            on_chasm = snapshot.chasm.get(unit)
+            if on_chasm is None or not unit.is_alive():
                 continue
-                
-            tile = self.owner.level.tiles[unit.x][unit.y]
 
-            if tile.is_chasm:
-                unit.deal_damage(self.get_stat("damage") * 2, Tags.Pure, self)
-                unit.deal_damage(self.get_stat("damage") * 2, Tags.Arcane, self)
-            elif has_adjacent_chasm(self.owner.level, unit.x, unit.y):
-                unit.deal_damage(self.get_stat("damage"), Tags.Pure, self)
-                unit.deal_damage(self.get_stat("damage"), Tags.Arcane, self)
+            damage = self.get_stat("damage") * (2 if on_chasm else 1)
+
+            deal_damages(self.owner.level, unit, [(damage, Tags.Pure), (damage, Tags.Arcane)], self)
 
-class Ozone(Upgrade):
+class Ozone(DamageTriggerUpgrade):
     def on_init(self):
         self.name = "Ozone"
         self.level = 4
@@ -163,7 +257,7 @@ class Ozone(Upgrade):
 
         self.asset = ["Cradle", "assets", "skills", "ozone"]
 
-        self.global_triggers[EventOnDamaged] = self.on_damage
+        self.add_damage_trigger(Tags.Lightning, self.on_damage, hostile=True)
 
         self.radius = 1
         self.duration = 2
@@ -175,23 +269,14 @@ class Ozone(Upgrade):
                 + mana_cloud_desc).format(**self.fmt_dict())
     
     def on_damage(self, evt):
-        if evt.damage_type != Tags.Lightning:
-            return
-        if not evt.unit:
-            return
-        if not are_hostile(self.owner, evt.unit):
-            return
-
-        for stage in Burst(self.owner.level, Point(evt.unit.x, evt.unit.y), self.get_stat("radius")):
+        placements = get_cloud_placements(self.owner.level)
+        for stage in get_burst(self.owner.level, Point(evt.unit.x, evt.unit.y), self.get_stat("radius")):
             for point in stage:
-                tile = self.owner.level.tiles[point.x][point.y]
-                if tile.cloud is not None:
-                    continue
+                placements.add(point.x, point.y, self.owner, self.get_stat("duration"), False, CLOUD_KEEP)
 
-                cloud = PureCloud(self.owner, self.get_stat("duration"), healing = False)
-                self.owner.level.add_obj(cloud, point.x, point.y)
+        placements.commit()
 
-class PermeatingLight(Upgrade):
+class PermeatingLight(SnapshotUpgrade):
     def on_init(self):
         self.name = "Permeating Light"
         self.level = 4
@@ -205,24 +290,25 @@ class PermeatingLight(Upgrade):
         return ("Your [holy] minions deal [{damage}_holy:holy] damage to [purified] enemies "
                 "within their line of sight each turn.\n").format(**self.fmt_dict())
     
-    def on_advance(self):
-        for unit in self.owner.level.units:
-            if are_hostile(self.owner, unit):
-                continue
+    def on_tick(self, snapshot):
+        purified = get_purified(self.owner.level)
+        if not purified:
+            return
 
-            if Tags.Holy not in unit.tags:
+        for unit in snapshot.holy_allies:
+            if not unit.is_alive():
                 continue
 
-            for enemy in self.owner.level.get_units_in_los(unit):
+            for enemy in get_units_in_los(self.owner.level, unit):
                 if not are_hostile(self.owner, enemy):
                     continue
                     
-                if not enemy.has_buff(PureBuff):
+                if enemy not in purified:
                     continue
                 
                 enemy.deal_damage(self.get_stat("damage"), Tags.Holy, self)
 
-class Mindlessness(Upgrade):
+class Mindlessness(SnapshotUpgrade):
     def on_init(self):
         self.name = "Mindlessness"
         self.level = 4
@@ -235,12 +321,27 @@ class Mindlessness(Upgrade):
         self.global_triggers[EventOnUnitAdded] = self.on_unit_added
         self.global_triggers[EventOnBuffApply] = self.on_buff_apply
         self.global_triggers[EventOnBuffRemove] = self.on_buff_remove
-        self.units = []
+
+        # Units with the bonus, and the damage each of their spells was given
+        self.units = weakref.WeakSet()
+        self.bonuses = weakref.WeakKeyDictionary()
 
     def get_description(self):
         return ("Your summoned [undead] units gain [100_pure:pure] resist.\n"
                 "They also gain a {damage} damage bonus to [physical] attacks while [purified].").format(**self.fmt_dict())
-    
+
+    # Weak containers can't be saved, so they're stored as lists
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["units"] = list(self.units)
+        state["bonuses"] = list(self.bonuses.items())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.units = weakref.WeakSet(self.units)
+        self.bonuses = weakref.WeakKeyDictionary(self.bonuses)
+
     def applicable(self, unit):
         if are_hostile(self.owner, unit):
             return False
@@ -248,13 +349,13 @@ class Mindlessness(Upgrade):
         if Tags.Undead not in unit.tags:
             return False
 
-        if not unit.has_buff(PureBuff):
+        if not is_purified(unit):
             return False
     
         return True
 
     def add_unit(self, unit):
-        self.units.append(unit)
+        self.units.add(unit)
         
         for spell in unit.spells:
             if not hasattr(spell, "damage_type") or spell.damage_type != Tags.Physical:
@@ -263,17 +364,15 @@ class Mindlessness(Upgrade):
                 continue
             
             spell.damage += self.damage
+            self.bonuses[spell] = self.damage
 
     def remove_unit(self, unit):
-        self.units.remove(unit)
+        self.units.discard(unit)
         
         for spell in unit.spells:
-            if not hasattr(spell, "damage_type") or spell.damage_type != Tags.Physical:
-                continue
-            if not hasattr(spell, "damage"):
-                continue
-            
-            spell.damage -= self.damage
+            bonus = self.bonuses.pop(spell, None)
+            if bonus is not None:
+                spell.damage -= bonus
 
     def update_unit(self, unit):
         if unit in self.units and not self.applicable(unit):
@@ -282,17 +381,22 @@ class Mindlessness(Upgrade):
             self.add_unit(unit)
 
     def on_buff_apply(self, evt):
-        if evt.unit is not None:
+        if evt.unit is not None and isinstance(evt.buff, PureBuff):
             self.update_unit(evt.unit)
 
     def on_buff_remove(self, evt):
-        if evt.unit is not None:
+        if evt.unit is not None and isinstance(evt.buff, PureBuff):
             self.update_unit(evt.unit)
 
-    def on_advance(self):
-        for unit in self.owner.level.units:
+    # Catches units that changed sides or lost their tags without a purification changing
+    def on_tick(self, snapshot):
+        for unit in list(self.units):
             self.update_unit(unit)
 
+        for unit in snapshot.undead_allies:
+            if unit not in self.units and unit.is_alive():
+                self.update_unit(unit)
+
     def on_unit_added(self, evt):
         if are_hostile(self.owner, evt.unit):
             return
@@ -302,7 +406,7 @@ class Mindlessness(Upgrade):
 
         evt.unit.resists[Tags.Pure] += 100
 
-class ManaPrism(Upgrade):
+class ManaPrism(DamageTriggerUpgrade):
     def on_init(self):
         self.name = "Mana Prism"
         self.level = 4
@@ -311,28 +415,25 @@ class ManaPrism(Upgrade):
         self.damage = 6
         self.radius = 2
 
-        self.global_triggers[EventOnDamaged] = self.on_damage
+        self.add_damage_trigger(Tags.Pure, self.on_damage, own_source=True)
     
     def get_description(self):
         return ("Deals 1 [fire], [lightning], [ice], [holy], [dark], and [arcane] damage when an enemy takes [pure] damage."
                 ).format(**self.fmt_dict())
     
     def on_damage(self, evt):
-        if evt.source is None:
-            return
-        if not hasattr(evt.source, "owner"):
-            return
-        if not evt.source.owner == self.owner:
-            return
-        if not evt.damage_type == Tags.Pure:
-            return
         if evt.unit is None:
             return
         
-        for damage_type in [Tags.Fire, Tags.Lightning, Tags.Ice, Tags.Holy, Tags.Dark, Tags.Arcane]:
-            if not evt.unit.is_alive():
-                break
-            self.owner.level.deal_damage(evt.unit.x, evt.unit.y, self.get_stat("damage"), damage_type, self)
+        get_chain_reactions(self.owner.level).push(None, self.refract, evt.unit)
+
+    def refract(self, unit):
+        damage = self.get_stat("damage")
+        damage_types = [Tags.Fire, Tags.Lightning, Tags.Ice, Tags.Holy, Tags.Dark, Tags.Arcane]
+        deal_damages(self.owner.level, unit, [(damage, damage_type) for damage_type in damage_types], self)
+
+    def on_advance(self):
+        get_chain_reactions(self.owner.level).drain()
 
 skill_constructors.append(CleansingFlame)
 skill_constructors.append(SpiritCorruption)
@@ -1,13 +1,433 @@
-from Level import Point, Level, Tile
+from Level import Point, Level, Tile, Burst, Unit, EventOnDamaged, are_hostile
 from typing import Callable, List
+from collections import OrderedDict, deque
+import functools
 import math
+import time
+import weakref
 import numpy as np
 
+_terrain_versions = weakref.WeakKeyDictionary()
+
+def terrain_version(level: Level) -> int:
+    """
+    Returns a counter that changes every time a tile in the level is turned into a wall, floor or chasm.
+    Caches of level geometry should include it in their keys.
+    """
+    return _terrain_versions.get(level, 0)
+
+class TerrainGrids:
+    """
+    Boolean grids of the level's walls and chasms, and of the tiles next to them, indexed by [x, y].
+    Built once per level and kept up to date as tiles change.
+    """
+    def __init__(self, level):
+        self.level = level
+
+        self.wall = np.zeros((level.width, level.height), dtype=bool)
+        self.chasm = np.zeros((level.width, level.height), dtype=bool)
+
+        for x in range(level.width):
+            for y in range(level.height):
+                tile = level.tiles[x][y]
+                self.wall[x, y] = tile.is_wall()
+                self.chasm[x, y] = tile.is_chasm
+
+        self.adjacent_wall = self.__dilate(self.wall)
+        self.adjacent_chasm = self.__dilate(self.chasm)
+
+    # Marks every tile with at least one of its 8 neighbours set in grid
+    def __dilate(self, grid):
+        padded = np.pad(grid, 1)
+        result = np.zeros(grid.shape, dtype=bool)
+
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                if dx == 0 and dy == 0:
+                    continue
+                result |= padded[1 + dx:grid.shape[0] + 1 + dx, 1 + dy:grid.shape[1] + 1 + dy]
+        
+        return result
+
+    def update(self, x, y):
+        tile = self.level.tiles[x][y]
+        self.wall[x, y] = tile.is_wall()
+        self.chasm[x, y] = tile.is_chasm
+
+        width, height = self.wall.shape
+
+        # Only the changed tile and its neighbours can have different adjacency
+        for nx in range(max(0, x - 1), min(width, x + 2)):
+            for ny in range(max(0, y - 1), min(height, y + 2)):
+                x_slice = slice(max(0, nx - 1), min(width, nx + 2))
+                y_slice = slice(max(0, ny - 1), min(height, ny + 2))
+
+                self.adjacent_wall[nx, ny] = np.count_nonzero(self.wall[x_slice, y_slice]) > self.wall[nx, ny]
+                self.adjacent_chasm[nx, ny] = np.count_nonzero(self.chasm[x_slice, y_slice]) > self.chasm[nx, ny]
+
+_terrain_grids = weakref.WeakKeyDictionary()
+
+def get_terrain_grids(level: Level) -> TerrainGrids:
+    grids = _terrain_grids.get(level)
+    if grids is None:
+        grids = TerrainGrids(level)
+        _terrain_grids[level] = grids
+    
+    return grids
+
+def _on_terrain_changed(level, x, y, *args, **kwargs):
+    _terrain_versions[level] = terrain_version(level) + 1
+
+    grids = _terrain_grids.get(level)
+    if grids is not None:
+        grids.update(x, y)
+
+def add_level_hook(method_name: str, hook: Callable):
+    """
+    Calls hook(level, *args, **kwargs) after every call to the given Level method, with the same arguments.
+    """
+    wrapped = getattr(Level, method_name)
+
+    # The hooks live on the wrapper, so the method is only wrapped once even if this module is imported again.
+    # Hooks are keyed by name, so a second import replaces them instead of adding copies.
+    if not getattr(wrapped, "cradle_tracked", False):
+        method = wrapped
+        hooks = {}
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            for level_hook in list(hooks.values()):
+                level_hook(self, *args, **kwargs)
+            return result
+
+        wrapper.cradle_tracked = True
+        wrapper.cradle_hooks = hooks
+        setattr(Level, method_name, wrapper)
+        wrapped = wrapper
+
+    wrapped.cradle_hooks[(hook.__module__, hook.__qualname__)] = hook
+
+_headless_default = False
+_headless_levels = weakref.WeakKeyDictionary()
+
+def set_headless(enabled: bool, level: Level = None):
+    """
+    Turns headless mode on or off for one level, or for every level without its own setting if level is None.
+    In headless mode Cradle spells resolve in a single step and effects aren't shown, for casts nobody is watching.
+    """
+    global _headless_default
+
+    if level is None:
+        _headless_default = enabled
+    else:
+        _headless_levels[level] = enabled
+
+def is_headless(level: Level) -> bool:
+    if level is None:
+        return _headless_default
+
+    return _headless_levels.get(level, _headless_default)
+
+def fast_forward(cast: Callable = None, get_level: Callable = None) -> Callable:
+    """
+    Wraps a spell's cast generator so it runs to completion on its first step when the caster's level is headless.
+    Everything it does happens in the same order, just without the pauses for animation.
+
+    get_level: takes the spell and returns the level it's cast in, for spells whose caster isn't set.
+    Defaults to the caster's level. Pass it as @fast_forward(get_level=...).
+    """
+    if cast is None:
+        return lambda cast: fast_forward(cast, get_level)
+
+    @functools.wraps(cast)
+    def wrapper(self, *args, **kwargs):
+        steps = cast(self, *args, **kwargs)
+
+        if get_level is not None:
+            level = get_level(self)
+        else:
+            level = getattr(self.caster, "level", None)
+
+        if is_headless(level):
+            for _ in steps:
+                pass
+            return
+
+        yield from steps
+
+    return wrapper
+
+CAST_MAX_FRAMES = 24
+CAST_FRAME_BUDGET = 0.01
+
+class CastFrames:
+    """
+    Spreads a cast's steps over at most max_frames animation frames, in order.
+    Steps are grouped evenly, at least per_frame to a frame, and a frame is also cut short once its work has taken budget seconds.
+    The cast yields through it with yield from frames.tick() after each step.
+    """
+    def __init__(self, steps: int, per_frame: int = 1, max_frames: int = CAST_MAX_FRAMES, budget: float = CAST_FRAME_BUDGET):
+        self.steps = max(steps, 1)
+        self.max_frames = min(max_frames, -(-self.steps // per_frame))
+        self.budget = budget
+
+        self.done = 0
+        self.frames = 0
+        self.frame_start = time.perf_counter()
+
+    def tick(self):
+        self.done += 1
+
+        # Frames cut short by the budget count towards the cap too
+        due = self.done * self.max_frames // self.steps > self.frames
+        over_budget = time.perf_counter() - self.frame_start >= self.budget
+        if self.frames < self.max_frames and (due or over_budget):
+            self.frames += 1
+            yield
+            self.frame_start = time.perf_counter()
+
+_show_effect = Level.show_effect
+
+def _show_effect_unless_headless(self, *args, **kwargs):
+    if is_headless(self):
+        return
+    return _show_effect(self, *args, **kwargs)
+
+Level.show_effect = _show_effect_unless_headless
+
+add_level_hook("make_wall", _on_terrain_changed)
+add_level_hook("make_floor", _on_terrain_changed)
+add_level_hook("make_chasm", _on_terrain_changed)
+
+_unit_versions = weakref.WeakKeyDictionary()
+
+def unit_version(level: Level) -> int:
+    """
+    Returns a counter that changes every time a unit is added to, removed from or moved within the level.
+    """
+    return _unit_versions.get(level, 0)
+
+def _on_unit_changed(level, obj, *args, **kwargs):
+    if isinstance(obj, Unit):
+        _unit_versions[level] = unit_version(level) + 1
+
+add_level_hook("add_obj", _on_unit_changed)
+add_level_hook("remove_obj", _on_unit_changed)
+add_level_hook("act_move", _on_unit_changed)
+
+_unit_indices = weakref.WeakKeyDictionary()
+
+class UnitIndex:
+    """
+    Finds a level's units near a point or by tag without checking every unit. Results are in level.units order.
+
+    Points are looked up on the level's own tiles, which already form a grid of units, so the index itself only
+    holds a bucket for each tag that has been asked for. Tag buckets are rebuilt once a turn, so a unit that
+    changes tags mid-turn is still found under the old ones until the next turn.
+    """
+    def __init__(self, level: Level):
+        self.level = level
+        self.turn = level.turn_no
+
+        # tag -> units with the tag, in level.units order
+        self.tags = {}
+
+    def add(self, unit: Unit):
+        self.remove(unit)
+
+        # Removals keep the buckets in level.units order, but a unit that wasn't appended means starting over
+        units = self.level.units
+        if not units or units[-1] is not unit:
+            self.tags.clear()
+            return
+
+        for tag, bucket in self.tags.items():
+            if tag in unit.tags:
+                bucket[unit] = None
+
+    def remove(self, unit: Unit):
+        for bucket in self.tags.values():
+            bucket.pop(unit, None)
+
+    def get_tag_bucket(self, tag) -> dict:
+        if self.turn != self.level.turn_no:
+            self.turn = self.level.turn_no
+            self.tags.clear()
+
+        bucket = self.tags.get(tag)
+        if bucket is None:
+            bucket = {unit: None for unit in self.level.units if tag in unit.tags}
+            self.tags[tag] = bucket
+
+        return bucket
+
+    def in_level_order(self, units: list) -> list:
+        if len(units) > 1:
+            units.sort(key=self.level.units.index)
+        return units
+
+    def near(self, point: Point, radius: int, tag = None) -> list:
+        """
+        Returns the units no more than radius tiles from point along either axis.
+        That square holds every tile a burst of the same radius can reach.
+        """
+        bucket = self.get_tag_bucket(tag) if tag is not None else None
+        tiles = self.level.tiles
+
+        units = []
+        for x in range(max(0, point.x - radius), min(self.level.width, point.x + radius + 1)):
+            column = tiles[x]
+            for y in range(max(0, point.y - radius), min(self.level.height, point.y + radius + 1)):
+                unit = column[y].unit
+                if unit is not None and (bucket is None or unit in bucket):
+                    units.append(unit)
+
+        return self.in_level_order(units)
+
+    def at(self, points) -> dict:
+        """
+        Returns the points that hold a unit, mapped to the unit.
+        """
+        tiles = self.level.tiles
+        units = {}
+        for point in points:
+            unit = tiles[point.x][point.y].unit
+            if unit is not None:
+                units[point] = unit
+
+        return units
+
+    def with_tag(self, tag) -> list:
+        return list(self.get_tag_bucket(tag))
+
+    def hostiles(self, unit: Unit, tag = None) -> list:
+        """
+        Returns the units hostile to the given unit, optionally only those with the tag.
+        """
+        candidates = self.get_tag_bucket(tag) if tag is not None else self.level.units
+        return [other for other in candidates if are_hostile(unit, other)]
+
+def get_unit_index(level: Level) -> UnitIndex:
+    index = _unit_indices.get(level)
+    if index is None:
+        index = UnitIndex(level)
+        _unit_indices[level] = index
+
+    return index
+
+def _on_unit_added(level, obj, x, y, *args, **kwargs):
+    index = _unit_indices.get(level)
+    if index is not None and isinstance(obj, Unit) and level.tiles[x][y].unit is obj:
+        index.add(obj)
+
+def _on_unit_removed(level, obj, *args, **kwargs):
+    index = _unit_indices.get(level)
+    if index is not None and isinstance(obj, Unit):
+        index.remove(obj)
+
+add_level_hook("add_obj", _on_unit_added)
+add_level_hook("remove_obj", _on_unit_removed)
+
+class LevelCache:
+    """
+    A least-recently-used cache of level geometry that is emptied whenever the level's terrain changes.
+    """
+    def __init__(self, level, max_size):
+        self.level = level
+        self.max_size = max_size
+        self.version = terrain_version(level)
+        self.entries = OrderedDict()
+
+    def lookup(self, key):
+        """
+        Returns the cached value for key, or None if there isn't one.
+        """
+        version = terrain_version(self.level)
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+
+        return value
+
+    def get(self, key, compute):
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        value = compute()
+        self.entries[key] = value
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return value
+
+def get_level_cache(caches: weakref.WeakKeyDictionary, level: Level, max_size: int) -> LevelCache:
+    cache = caches.get(level)
+    if cache is None:
+        cache = LevelCache(level, max_size)
+        caches[level] = cache
+
+    return cache
+
+def default_wall_func(tile: Tile) -> bool:
+    return tile.is_wall()
+
+class BouncingLine:
+    """
+    The result of tracing a bouncing line once through a level.
+
+    endpoints: the start, every bounce point and the final point.
+    tiles: every point the line passes through in order, including repeats. Worked out the first time it's needed.
+    bounce_indices: the indices in tiles where the line bounces.
+    """
+    def __init__(self, level, endpoints):
+        self.level = level
+        self.endpoints = endpoints
+        self.__tiles = None
+        self.__bounce_indices = None
+
+    def __trace_tiles(self):
+        tiles = []
+        bounce_indices = []
+        for i in range(len(self.endpoints) - 1):
+            tiles.extend(self.level.get_points_in_line(self.endpoints[i], self.endpoints[i + 1]))
+            if i < len(self.endpoints) - 2:
+                bounce_indices.append(len(tiles) - 1)
+
+        self.__tiles = tuple(tiles)
+        self.__bounce_indices = tuple(bounce_indices)
+
+    @property
+    def tiles(self) -> tuple:
+        if self.__tiles is None:
+            self.__trace_tiles()
+        return self.__tiles
+
+    @property
+    def bounce_indices(self) -> tuple:
+        if self.__bounce_indices is None:
+            self.__trace_tiles()
+        return self.__bounce_indices
+
+    def get_bounces(self) -> List[Point]:
+        return list(self.endpoints[1:-1])
+
+    def get_tiles(self, repeat_tiles: bool = False) -> List[Point]:
+        if repeat_tiles:
+            return list(self.tiles)
+
+        # dict keeps insertion order, so this removes duplicates without reordering
+        return list(dict.fromkeys(self.tiles))
+
 def __bounce(
     level: Level, 
     start: Point, 
     vel: np.array, 
-    max_length, wall_func: Callable[[Tile], bool] = lambda p: p.is_wall()):
+    max_length, wall_func: Callable[[Tile], bool] = default_wall_func):
 
     pos = np.array([float(start.x), float(start.y)])
 
@@ -57,17 +477,7 @@ def __bounce(
     return False, Point(int(pos[0]), int(pos[1])), vel
 
 
-def get_bouncing_line_endpoints(
-    level: Level,
-    start: Point,
-    angle: float,
-    max_length: float,
-    wall_func: Callable[[Tile], bool] = lambda p: p.is_wall()) -> List[Point]:
-    """
-    Finds the endpoints of a bouncing line through the given level. A new endpoint is found every time the line bounces.
-    
-    wall_func: takes a tile and returns whether it should be bounced off of.
-    """
+def _trace_bouncing_line(level, start, angle, max_length, wall_func):
     endpoints = [start]
 
     length_left = max_length
@@ -90,7 +500,182 @@ def get_bouncing_line_endpoints(
 
             current = end_point
 
-    return endpoints
+    return BouncingLine(level, tuple(endpoints))
+
+def _trace_bouncing_lines(level, start, angles, max_length, walls):
+    """
+    Steps one bouncing line per angle together, as arrays, and returns each line's endpoints.
+    Follows the same steps as _trace_bouncing_line, which is faster for a single line.
+
+    Each line moves one unit along its direction per step, starting from its tile's integer coordinates, and the
+    tile it's in is its position truncated towards zero. A line stops when it steps into a wall or its next step
+    would leave the level. When its next step would enter a wall, it bounces off whichever sides it's moving
+    towards are walls and starts again from the tile it bounced in, with the length it has left minus a half.
+    """
+    width, height = walls.shape
+    count = len(angles)
+
+    # math rather than np, so directions match a line traced on its own to the last bit
+    vel = np.array([[math.cos(angle), math.sin(angle)] for angle in angles]).reshape(count, 2)
+    current = np.tile(np.array([start.x, start.y], dtype=int), (count, 1))
+    pos = current.astype(float)
+    length_left = np.full(count, float(max_length))
+    steps = np.zeros(count, dtype=int)
+
+    endpoints = [[start] for _ in range(count)]
+    active = np.ones(count, dtype=bool)
+
+    def finish(lines, points):
+        for line, (x, y) in zip(lines, points):
+            endpoints[line].append(Point(int(x), int(y)))
+        active[lines] = False
+
+    def begin(lines):
+        pos[lines] = current[lines]
+        steps[lines] = np.trunc(length_left[lines]).astype(int)
+
+        empty = lines[steps[lines] <= 0]
+        finish(empty, current[empty])
+
+    def in_bounds(x, y):
+        return (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+    def is_wall(x, y):
+        inside = in_bounds(x, y)
+        result = np.zeros(len(x), dtype=bool)
+        result[inside] = walls[x[inside], y[inside]]
+        return result
+
+    begin(np.arange(count))
+
+    while active.any():
+        lines = np.nonzero(active)[0]
+
+        prev = np.trunc(pos[lines]).astype(int)
+        pos[lines] += vel[lines]
+        point = np.trunc(pos[lines]).astype(int)
+
+        # Stepped into a wall, or off the level
+        stopped = ~in_bounds(point[:, 0], point[:, 1])
+        stopped[~stopped] = is_wall(point[~stopped, 0], point[~stopped, 1])
+        finish(lines[stopped], prev[stopped])
+
+        lines, point = lines[~stopped], point[~stopped]
+
+        # The next step would leave the level
+        next_point = np.trunc(pos[lines] + vel[lines]).astype(int)
+        leaving = ~in_bounds(next_point[:, 0], next_point[:, 1])
+        finish(lines[leaving], point[leaving])
+
+        lines, point, next_point = lines[~leaving], point[~leaving], next_point[~leaving]
+
+        # The next step would enter a wall, so check each axis in the direction the line is moving
+        blocked = is_wall(next_point[:, 0], next_point[:, 1])
+        line_vel = vel[lines]
+        x, y = point[:, 0], point[:, 1]
+
+        bounce_horizontal = blocked & (
+            ((line_vel[:, 0] > 0) & is_wall(x + 1, y)) | ((line_vel[:, 0] < 0) & is_wall(x - 1, y)))
+        bounce_vertical = blocked & (
+            ((line_vel[:, 1] > 0) & is_wall(x, y + 1)) | ((line_vel[:, 1] < 0) & is_wall(x, y - 1)))
+
+        vel[lines[bounce_horizontal], 0] *= -1
+        vel[lines[bounce_vertical], 1] *= -1
+
+        bounced = bounce_horizontal | bounce_vertical
+        bounce_lines = lines[bounced]
+        for line, (bx, by) in zip(bounce_lines, point[bounced]):
+            endpoints[line].append(Point(int(bx), int(by)))
+
+        offset = point[bounced] - current[bounce_lines]
+        length_left[bounce_lines] -= np.sqrt((offset ** 2).sum(axis=1))
+        # Remove a bit of length to avoid any infinite loops, just in case
+        length_left[bounce_lines] -= 0.5
+        current[bounce_lines] = point[bounced]
+
+        spent = bounce_lines[length_left[bounce_lines] <= 0]
+        active[spent] = False
+        begin(bounce_lines[length_left[bounce_lines] > 0])
+
+        # Ran out of steps without bouncing
+        lines, point = lines[~bounced], point[~bounced]
+        steps[lines] -= 1
+        done = steps[lines] <= 0
+        finish(lines[done], point[done])
+
+    return [tuple(points) for points in endpoints]
+
+_wall_mask_caches = weakref.WeakKeyDictionary()
+
+def _get_wall_mask(level, wall_func):
+    if wall_func is default_wall_func:
+        return get_terrain_grids(level).wall
+
+    def build():
+        return np.array([[wall_func(level.tiles[x][y]) for y in range(level.height)] for x in range(level.width)], dtype=bool)
+
+    return get_level_cache(_wall_mask_caches, level, 8).get(wall_func, build)
+
+BOUNCING_LINE_CACHE_SIZE = 256
+_bouncing_line_caches = weakref.WeakKeyDictionary()
+
+def get_bouncing_line_traces(
+    level: Level,
+    start: Point,
+    angles,
+    max_length: float,
+    wall_func: Callable[[Tile], bool] = default_wall_func) -> List[BouncingLine]:
+    """
+    Traces a bouncing line for every angle at once. Gives the same lines as get_bouncing_line_trace, and shares its cache.
+    Lines already in the cache are reused and new ones are traced together over a wall mask.
+
+    wall_func: takes a tile and returns whether it should be bounced off of. Other than the default, it's applied
+    to the whole level once and the result kept until the terrain changes.
+    """
+    cache = get_level_cache(_bouncing_line_caches, level, BOUNCING_LINE_CACHE_SIZE)
+    start = Point(start.x, start.y)
+
+    lines = [cache.lookup((start, angle, max_length, wall_func)) for angle in angles]
+    missing = [i for i, line in enumerate(lines) if line is None]
+
+    if missing:
+        traced = _trace_bouncing_lines(level, start, [angles[i] for i in missing], max_length, _get_wall_mask(level, wall_func))
+        for i, endpoints in zip(missing, traced):
+            lines[i] = cache.get((start, angles[i], max_length, wall_func), lambda: BouncingLine(level, endpoints))
+
+    return lines
+
+def get_bouncing_line_trace(
+    level: Level,
+    start: Point,
+    angle: float,
+    max_length: float,
+    wall_func: Callable[[Tile], bool] = default_wall_func) -> BouncingLine:
+    """
+    Traces a bouncing line through the given level, reusing the last result for the same line if the terrain hasn't changed.
+    The most recently used BOUNCING_LINE_CACHE_SIZE lines are kept per level.
+
+    wall_func: takes a tile and returns whether it should be bounced off of.
+    """
+    cache = get_level_cache(_bouncing_line_caches, level, BOUNCING_LINE_CACHE_SIZE)
+    start = Point(start.x, start.y)
+
+    return cache.get(
+        (start, angle, max_length, wall_func),
+        lambda: _trace_bouncing_line(level, start, angle, max_length, wall_func))
+
+def get_bouncing_line_endpoints(
+    level: Level,
+    start: Point,
+    angle: float,
+    max_length: float,
+    wall_func: Callable[[Tile], bool] = default_wall_func) -> List[Point]:
+    """
+    Finds the endpoints of a bouncing line through the given level. A new endpoint is found every time the line bounces.
+    
+    wall_func: takes a tile and returns whether it should be bounced off of.
+    """
+    return list(get_bouncing_line_trace(level, start, angle, max_length, wall_func).endpoints)
 
 def get_bouncing_line(
     level: Level,
@@ -98,26 +683,648 @@ def get_bouncing_line(
     angle: float,
     max_length: float,
     repeat_tiles: bool = False,
-    wall_func: Callable[[Tile], bool] = lambda p: p.is_wall()) -> List[Point]:
+    wall_func: Callable[[Tile], bool] = default_wall_func) -> List[Point]:
     """
     Returns the points of a bouncing line through the given level.
 
     repeat_tiles: whether to repeat tiles if the line passes through more than once.
     wall_func: takes a tile and returns whether it should be bounced off of.
     """
-    tiles = []
-    endpoints = get_bouncing_line_endpoints(level, start, angle, max_length, wall_func)
+    return get_bouncing_line_trace(level, start, angle, max_length, wall_func).get_tiles(repeat_tiles)
 
-    for i in range(len(endpoints) - 1):
-        tiles.extend(level.get_points_in_line(endpoints[i], endpoints[i + 1]))
+BURST_CACHE_SIZE = 512
+_burst_caches = weakref.WeakKeyDictionary()
 
-    if not repeat_tiles:
-        # Can't use list(set()) because it doesn't preserve order
-        no_dupes = []
-        [no_dupes.append(t) for t in tiles if t not in no_dupes]
-        return no_dupes
-    
-    return tiles
+def get_burst(level: Level, origin: Point, radius: int, ignore_walls: bool = False) -> tuple:
+    """
+    Returns the stages of Burst(level, origin, radius) as tuples of points.
+    The most recently used BURST_CACHE_SIZE bursts are kept per level until the terrain changes.
+    """
+    cache = get_level_cache(_burst_caches, level, BURST_CACHE_SIZE)
+    origin = Point(origin.x, origin.y)
+
+    return cache.get(
+        (origin, radius, ignore_walls),
+        lambda: tuple(tuple(stage) for stage in Burst(level, origin, radius, ignore_walls=ignore_walls)))
+
+def get_burst_points(level: Level, origin: Point, radius: int, ignore_walls: bool = False) -> List[Point]:
+    return [p for stage in get_burst(level, origin, radius, ignore_walls) for p in stage]
+
+_burst_area_caches = weakref.WeakKeyDictionary()
+
+def get_burst_area(level: Level, origin: Point, radius: int, ignore_walls: bool = False) -> dict:
+    """
+    Returns every point of Burst(level, origin, radius) mapped to its position in stage order,
+    for membership tests and for putting things in the order the burst reaches them.
+    """
+    cache = get_level_cache(_burst_area_caches, level, BURST_CACHE_SIZE)
+    origin = Point(origin.x, origin.y)
+
+    def build():
+        area = {}
+        for point in get_burst_points(level, origin, radius, ignore_walls):
+            area.setdefault(point, len(area))
+        return area
+
+    return cache.get((origin, radius, ignore_walls), build)
+
+_los_caches = weakref.WeakKeyDictionary()
+
+def get_units_in_los(level: Level, point: Point, units = None) -> tuple:
+    """
+    Returns the units in line of sight of the given point, like level.get_units_in_los.
+    Results are shared between callers until a unit is added, removed or moved, or the terrain changes.
+
+    units: only check these units, keeping their order. The shared result is used if there is one,
+    otherwise only these units are checked and nothing is cached.
+    """
+    cache = _los_caches.get(level)
+    versions = (terrain_version(level), unit_version(level))
+
+    if cache is not None and cache[0] != versions:
+        cache = None
+        del _los_caches[level]
+
+    point = Point(point.x, point.y)
+    in_los = cache[1].get(point) if cache is not None else None
+
+    if units is not None:
+        if in_los is None:
+            return tuple(unit for unit in units if level.can_see(point.x, point.y, unit.x, unit.y))
+        return tuple(unit for unit in units if unit in in_los)
+
+    if in_los is None:
+        if cache is None:
+            cache = (versions, {})
+            _los_caches[level] = cache
+
+        in_los = tuple(level.get_units_in_los(point))
+        cache[1][point] = in_los
+
+    return in_los
+
+def get_multi_burst(level: Level, sources, radius: int = None, ignore_walls: bool = False) -> dict:
+    """
+    Bursts from many points at once and returns a dict from every point reached to the lowest stage it was reached at.
+    Points are in stage order. Expands the same way as Burst, but in a single pass however much the bursts overlap.
+
+    sources: points, or (point, radius) pairs to give each source its own radius.
+    radius: the radius of sources given as plain points.
+    """
+    grids = get_terrain_grids(level)
+    width, height = grids.wall.shape
+
+    distances = {}
+    # How many more stages each point can still expand, taking the best of every burst that reached it
+    budgets = {}
+    frontier = {}
+
+    for source in sources:
+        if isinstance(source, tuple) and not isinstance(source, Point):
+            source, source_radius = source
+        else:
+            source_radius = radius
+
+        point = Point(source.x, source.y)
+        distances.setdefault(point, 0)
+
+        if source_radius > budgets.get(point, -1):
+            budgets[point] = source_radius
+            frontier[point] = source_radius
+
+    stage = 0
+    while frontier:
+        stage += 1
+        next_frontier = {}
+
+        for point, budget in frontier.items():
+            if budget < 1:
+                continue
+
+            for x in range(max(0, point.x - 1), min(width, point.x + 2)):
+                for y in range(max(0, point.y - 1), min(height, point.y + 2)):
+                    if not ignore_walls and grids.wall[x, y]:
+                        continue
+
+                    # Skip points already reached by a burst with at least as much radius left
+                    neighbour = Point(x, y)
+                    if budget - 1 <= budgets.get(neighbour, -1):
+                        continue
+
+                    budgets[neighbour] = budget - 1
+                    distances.setdefault(neighbour, stage)
+                    next_frontier[neighbour] = budget - 1
+
+        frontier = next_frontier
+
+    return dict(sorted(distances.items(), key=lambda item: item[1]))
+
+def get_nearest_tiles(level: Level, origin: Point, count: int, blocked: np.ndarray) -> List[Point]:
+    """
+    Returns up to count points nearest to origin, by the stages of a Burst from it, where blocked[x, y] is False.
+    The origin itself is never returned.
+
+    Only the square around the origin that the burst has reached so far is searched,
+    so finding tiles close by doesn't touch the rest of the level.
+    """
+    grids = get_terrain_grids(level)
+    width, height = grids.wall.shape
+
+    reached = np.zeros((width, height), dtype=bool)
+    reached[origin.x, origin.y] = True
+    frontier = reached.copy()
+
+    points = []
+    stage = 0
+    while len(points) < count:
+        stage += 1
+        x0, x1 = max(0, origin.x - stage), min(width, origin.x + stage + 1)
+        y0, y1 = max(0, origin.y - stage), min(height, origin.y + stage + 1)
+
+        # Every point next to the frontier, diagonals included. The frontier is inside the last stage's square,
+        # so all of its neighbours are inside this one.
+        last = frontier[x0:x1, y0:y1]
+        near = last.copy()
+        near[1:, :] |= last[:-1, :]
+        near[:-1, :] |= last[1:, :]
+        grown = near.copy()
+        grown[:, 1:] |= near[:, :-1]
+        grown[:, :-1] |= near[:, 1:]
+
+        new = grown & ~grids.wall[x0:x1, y0:y1] & ~reached[x0:x1, y0:y1]
+        if not new.any():
+            break
+
+        reached[x0:x1, y0:y1] |= new
+        frontier[x0:x1, y0:y1] = new
+
+        for x, y in np.argwhere(new & ~blocked[x0:x1, y0:y1]):
+            points.append(Point(x0 + int(x), y0 + int(y)))
+            if len(points) == count:
+                break
+
+    return points
+
+def get_chained_burst(level: Level, origin: Point, radius: int, links: np.ndarray) -> dict:
+    """
+    Bursts from origin, then again from every link point a burst reaches, until no more links are reached.
+    Returns a dict from every point reached to its stage in the nearest burst, in stage order like get_multi_burst.
+
+    links: a grid of the points that burst again when reached, indexed by [x, y].
+    """
+    grids = get_terrain_grids(level)
+
+    # How many more stages each point can still expand, taking the best of every burst that reached it
+    budget = np.full(grids.wall.shape, -1, dtype=np.int32)
+    budget[origin.x, origin.y] = radius
+
+    while True:
+        reached = budget.copy()
+        reached[1:, :] = np.maximum(reached[1:, :], budget[:-1, :])
+        reached[:-1, :] = np.maximum(reached[:-1, :], budget[1:, :])
+        spread = reached.copy()
+        spread[:, 1:] = np.maximum(spread[:, 1:], reached[:, :-1])
+        spread[:, :-1] = np.maximum(spread[:, :-1], reached[:, 1:])
+
+        spread -= 1
+        spread[grids.wall] = -1
+
+        expanded = np.maximum(budget, spread)
+        expanded[links & (expanded >= 0)] = radius
+
+        if np.array_equal(expanded, budget):
+            break
+        budget = expanded
+
+    points = np.argwhere(budget >= 0)
+    stages = radius - budget[budget >= 0]
+    order = np.argsort(stages, kind="stable")
+
+    return {Point(int(points[i][0]), int(points[i][1])): int(stages[i]) for i in order}
+
+OBJECT_POOL_SIZE = 256
+_object_pools = weakref.WeakKeyDictionary()
+
+class ObjectPool:
+    """
+    Objects of one type that left a level, kept to be reinitialized and reused instead of reallocated.
+    An object is only handed out again after the turn it was released in,
+    so anything still holding it from that turn, like the level's list of clouds to advance, is done with it.
+    """
+    def __init__(self, level: Level, max_size: int = OBJECT_POOL_SIZE):
+        self.level = level
+        self.max_size = max_size
+        self.items = deque()
+
+    def release(self, obj):
+        if len(self.items) < self.max_size:
+            self.items.append((self.level.turn_no, obj))
+
+    def take(self):
+        if self.items and self.items[0][0] < self.level.turn_no:
+            return self.items.popleft()[1]
+        return None
+
+def get_object_pool(level: Level, cls: type) -> ObjectPool:
+    pools = _object_pools.get(level)
+    if pools is None:
+        pools = {}
+        _object_pools[level] = pools
+
+    pool = pools.get(cls)
+    if pool is None:
+        pool = ObjectPool(level)
+        pools[cls] = pool
+
+    return pool
+
+class SpellPlan:
+    """
+    The geometry a spell works out for one target, shared by its targeting preview and its cast.
+
+    tiles: the impacted tiles shown while targeting.
+    stages: groups of points in the order the cast animates them.
+    Anything else a spell needs, like bounce points or burst regions, is passed as a keyword and stored as an attribute.
+    """
+    def __init__(self, tiles, stages = (), **extra):
+        self.tiles = tuple(tiles)
+        self.stages = tuple(stages)
+        self.__dict__.update(extra)
+
+SPELL_PLAN_CACHE_SIZE = 8
+_spell_plan_caches = weakref.WeakKeyDictionary()
+
+def get_spell_plan(spell, x: int, y: int, stats: tuple, build: Callable[[], SpellPlan]) -> SpellPlan:
+    """
+    Returns the spell's plan for the target, calling build only if there isn't one for the same stats,
+    caster position, target and terrain.
+
+    stats: the spell's stats that change its geometry, like radius.
+    """
+    level = spell.caster.level
+
+    level_ref, cache = _spell_plan_caches.get(spell, (None, None))
+    if cache is None or level_ref() is not level:
+        cache = OrderedDict()
+        _spell_plan_caches[spell] = (weakref.ref(level), cache)
+
+    key = (terrain_version(level), stats, spell.caster.x, spell.caster.y, x, y)
+    plan = cache.get(key)
+
+    if plan is not None:
+        cache.move_to_end(key)
+        return plan
+
+    plan = build()
+    cache[key] = plan
+
+    if len(cache) > SPELL_PLAN_CACHE_SIZE:
+        cache.popitem(last=False)
+
+    return plan
+
+class DamageDispatcher:
+    """
+    Routes the level's damage events to handlers by damage type, and optionally by the owner of the source,
+    so handlers are only called for damage they care about.
+    A single global EventOnDamaged trigger is registered for the level while any handler is subscribed.
+    """
+    def __init__(self, level: Level):
+        self.level = level
+        # (damage type, source owner or None) -> tuple of (subscription number, handler, unit the damaged unit must be hostile to or None)
+        self.handlers = {}
+        self.subscriptions = 0
+
+    def subscribe(self, damage_type, handler: Callable, hostile_to: Unit = None, source_owner: Unit = None):
+        if not self.handlers:
+            self.level.event_manager.register_global_trigger(EventOnDamaged, self.on_damaged)
+
+        key = (damage_type, source_owner)
+        self.subscriptions += 1
+        self.handlers[key] = self.handlers.get(key, ()) + ((self.subscriptions, handler, hostile_to),)
+
+    def unsubscribe(self, damage_type, handler: Callable, source_owner: Unit = None):
+        key = (damage_type, source_owner)
+        entries = tuple(entry for entry in self.handlers.get(key, ()) if entry[1] != handler)
+
+        if entries:
+            self.handlers[key] = entries
+        else:
+            self.handlers.pop(key, None)
+
+            if not self.handlers:
+                self.level.event_manager.unregister_global_trigger(EventOnDamaged, self.on_damaged)
+
+    def on_damaged(self, evt):
+        entries = self.handlers.get((evt.damage_type, None), ())
+
+        source_owner = getattr(evt.source, "owner", None)
+        if source_owner is not None:
+            owned = self.handlers.get((evt.damage_type, source_owner), ())
+            if owned:
+                # Handlers run in the order they subscribed, like the engine's own triggers
+                entries = sorted(entries + owned) if entries else owned
+
+        for number, handler, hostile_to in entries:
+            if hostile_to is not None and (evt.unit is None or not are_hostile(hostile_to, evt.unit)):
+                continue
+            handler(evt)
+
+def get_damage_dispatcher(level: Level) -> DamageDispatcher:
+    """
+    Returns the level's damage dispatcher.
+    It's kept on the level itself so it's saved along with the triggers it registered.
+    """
+    dispatcher = getattr(level, "cradle_damage_dispatcher", None)
+    if dispatcher is None:
+        dispatcher = DamageDispatcher(level)
+        level.cradle_damage_dispatcher = dispatcher
+
+    return dispatcher
+
+def deal_damages(level: Level, target, damages, source) -> int:
+    """
+    Deals several (amount, damage type) hits back to back, stopping as soon as the unit being hit dies.
+    Returns the total damage dealt.
+
+    target: a unit, which is followed if it moves, or a tile, which is hit in place.
+    """
+    if isinstance(target, Unit):
+        unit = target
+    else:
+        unit = level.get_unit_at(target.x, target.y)
+
+    total = 0
+    for amount, damage_type in damages:
+        if unit is not None and not unit.is_alive():
+            break
+
+        if unit is target:
+            total += level.deal_damage(unit.x, unit.y, amount, damage_type, source)
+        else:
+            total += level.deal_damage(target.x, target.y, amount, damage_type, source)
+
+    return total
+
+def deal_area_damage(level: Level, footprint, amount: int, damage_type, source, before_hit: Callable = None, after_hit: Callable = None) -> int:
+    """
+    Deals damage to every point of footprint in order, and returns the total damage dealt.
+    Points with a unit, cloud or prop go through level.deal_damage, since the engine and other mods act on them.
+    The damage effect for the other points is shown in one batch at the end.
+
+    before_hit, after_hit: called with each unit before and after it takes damage.
+    """
+    footprint = list(footprint)
+    occupied = get_unit_index(level).at(footprint)
+    version = unit_version(level)
+
+    tiles = level.tiles
+    total = 0
+    empty = []
+    for point in footprint:
+        tile = tiles[point.x][point.y]
+
+        # Once a hit has added, removed or moved a unit the lookup is out of date, so read the tiles from then on
+        if version is not None and unit_version(level) != version:
+            version = None
+        unit = occupied.get(point) if version is not None else tile.unit
+
+        if unit is None and tile.cloud is None and tile.prop is None:
+            empty.append(point)
+            continue
+
+        if unit is not None and before_hit is not None:
+            before_hit(unit)
+
+        total += level.deal_damage(point.x, point.y, amount, damage_type, source)
+
+        if unit is not None and after_hit is not None:
+            after_hit(unit)
+
+    if empty and not is_headless(level):
+        for point in empty:
+            level.show_effect(point.x, point.y, damage_type)
+
+    return total
+
+CHAIN_REACTION_BUDGET = 512
+_chain_reactions = weakref.WeakKeyDictionary()
+
+class ChainReactionQueue:
+    """
+    Runs effects that are triggered by other effects one after another instead of recursively.
+
+    Effects pushed while the queue is draining wait for their turn, so a chain of explosions never gets deeper
+    than one handler. Effects pushed with a key that's already waiting are dropped.
+    At most budget effects run each turn; the rest wait for the next turn's drain.
+    """
+    def __init__(self, level: Level, budget: int = CHAIN_REACTION_BUDGET):
+        self.level = level
+        self.budget = budget
+        self.items = deque()
+        self.pending = set()
+        self.draining = False
+        self.turn = None
+        self.work = 0
+
+    def push(self, key, func: Callable, *args):
+        """
+        key: identifies the effect for deduplication, like (upgrade, unit). None is never deduplicated.
+        """
+        if key is not None:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+
+        self.items.append((key, func, args))
+        self.drain()
+
+    def drain(self):
+        if self.draining:
+            return
+
+        if self.turn != self.level.turn_no:
+            self.turn = self.level.turn_no
+            self.work = 0
+
+        self.draining = True
+        try:
+            while self.items and self.work < self.budget:
+                key, func, args = self.items.popleft()
+                self.pending.discard(key)
+                self.work += 1
+                func(*args)
+        finally:
+            self.draining = False
+
+def get_chain_reactions(level: Level) -> ChainReactionQueue:
+    queue = _chain_reactions.get(level)
+    if queue is None:
+        queue = ChainReactionQueue(level)
+        _chain_reactions[level] = queue
+
+    return queue
+
+# Effects left waiting when the budget ran out run once the turn is over,
+# whether or not the player owns an upgrade that drains the queue itself
+def _drain_chain_reactions(level, *args, **kwargs):
+    queue = _chain_reactions.get(level)
+    if queue is not None:
+        queue.drain()
+
+add_level_hook("advance", _drain_chain_reactions)
+
+def get_hostile_weights(level: Level, unit: Unit, damage: int = None, damage_type = None) -> np.ndarray:
+    """
+    Returns a grid indexed by [x, y] with the tile of every unit hostile to unit set to 1,
+    or, given damage, to the damage that unit would take after resistances.
+    """
+    weights = np.zeros((level.width, level.height))
+
+    for hostile in get_unit_index(level).hostiles(unit):
+        if damage is None:
+            weights[hostile.x, hostile.y] = 1
+        else:
+            weights[hostile.x, hostile.y] = max(0, damage * (100 - hostile.resists[damage_type]) / 100)
+
+    return weights
+
+_castable_caches = weakref.WeakKeyDictionary()
+
+def get_castable_grid(spell) -> np.ndarray:
+    """
+    Returns a boolean grid of the tiles spell.can_cast accepts.
+    The caster's own tile is left out unless the spell can target its caster or is cast on itself with range 0.
+    Kept until the caster moves, the spell's range changes or the level's units or terrain change.
+    """
+    level = spell.caster.level
+    spell_range = spell.get_stat("range")
+    key = (terrain_version(level), unit_version(level), spell.caster.x, spell.caster.y, spell_range)
+
+    level_ref, cached_key, castable = _castable_caches.get(spell, (None, None, None))
+    if castable is not None and level_ref() is level and cached_key == key:
+        return castable
+
+    castable = np.zeros((level.width, level.height), dtype=bool)
+    for x in range(max(0, spell.caster.x - spell_range), min(level.width, spell.caster.x + spell_range + 1)):
+        for y in range(max(0, spell.caster.y - spell_range), min(level.height, spell.caster.y + spell_range + 1)):
+            castable[x, y] = spell.can_cast(x, y)
+
+    if spell_range > 0 and not getattr(spell, "can_target_self", False):
+        castable[spell.caster.x, spell.caster.y] = False
+
+    _castable_caches[spell] = (weakref.ref(level), key, castable)
+    return castable
+
+_burst_template_caches = weakref.WeakKeyDictionary()
+
+def _get_burst_template(level: Level, radius: int):
+    """
+    Returns the offsets of a burst's points from its origin in open ground, and how far they reach along either axis.
+    Returns None if the level is too small to hold a whole burst.
+    """
+    def build():
+        origin = Point(level.width // 2, level.height // 2)
+        points = get_burst_area(level, origin, radius, ignore_walls=True)
+
+        if any(p.x in (0, level.width - 1) or p.y in (0, level.height - 1) for p in points):
+            return None
+
+        offsets = tuple((p.x - origin.x, p.y - origin.y) for p in points)
+        reach = max(max(abs(dx), abs(dy)) for dx, dy in offsets)
+        return offsets, reach
+
+    # Stored as False when there's no template, since the cache treats None as missing
+    template = get_level_cache(_burst_template_caches, level, BURST_CACHE_SIZE).get(radius, lambda: build() or False)
+    return template or None
+
+def _box_sums(grid: np.ndarray, reach: int) -> np.ndarray:
+    """
+    Returns the sum of grid over the (2 * reach + 1) square around each tile, from a summed-area table.
+    """
+    width, height = grid.shape
+    size = 2 * reach + 1
+
+    table = np.zeros((width + size, height + size))
+    table[1:, 1:] = np.pad(grid, reach).cumsum(0).cumsum(1)
+
+    return table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+
+_burst_index_caches = weakref.WeakKeyDictionary()
+
+def _get_burst_indices(level: Level, origin: Point, radius: int) -> tuple:
+    """
+    Returns the points of Burst(level, origin, radius) as x and y index arrays.
+    """
+    cache = get_level_cache(_burst_index_caches, level, BURST_CACHE_SIZE)
+
+    def build():
+        points = get_burst_area(level, origin, radius)
+        return np.array([p.x for p in points], dtype=int), np.array([p.y for p in points], dtype=int)
+
+    return cache.get((origin, radius), build)
+
+def get_burst_heatmap(level: Level, weights: np.ndarray, castable: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Sums weights over Burst(level, target, radius) for every castable target at once. Other targets score -1.
+
+    Targets in open ground are scored by summing shifted copies of weights, one per point of the burst's shape.
+    Targets with both a wall and something to hit within radius are scored from their actual burst.
+    """
+    scores = np.full(weights.shape, -1.0)
+    exact = castable & (_box_sums(weights, radius) > 0)
+
+    template = _get_burst_template(level, radius)
+    if template is not None:
+        offsets, reach = template
+        width, height = weights.shape
+
+        padded = np.pad(weights, reach)
+        sums = np.zeros(weights.shape)
+        for dx, dy in offsets:
+            sums += padded[reach + dx:reach + dx + width, reach + dy:reach + dy + height]
+
+        scores[castable] = sums[castable]
+        exact &= _box_sums(get_terrain_grids(level).wall, radius) > 0
+    else:
+        scores[castable] = 0
+
+    for x, y in zip(*np.nonzero(exact)):
+        xs, ys = _get_burst_indices(level, Point(int(x), int(y)), radius)
+        scores[x, y] = weights[xs, ys].sum()
+
+    return scores
+
+def get_impacted_heatmap(spell, weights: np.ndarray, castable: np.ndarray) -> np.ndarray:
+    """
+    Sums weights over spell.get_impacted_tiles for every castable target, one target at a time. Other targets score -1.
+    """
+    scores = np.full(weights.shape, -1.0)
+
+    for x, y in zip(*np.nonzero(castable)):
+        scores[x, y] = sum(weights[p.x, p.y] for p in set(spell.get_impacted_tiles(int(x), int(y))))
+
+    return scores
+
+def get_target_heatmap(spell, damage_type = None) -> np.ndarray:
+    """
+    Scores every tile as a target for spell, as a grid indexed by [x, y].
+    Scores are the number of enemies hit or, given damage_type, the damage they'd take from the spell's damage stat.
+    Tiles the spell can't be cast at score -1.
+
+    Spells can score their targets faster with get_heatmap(weights, castable), where weights is a grid of the score of
+    hitting each tile. Otherwise targets are scored from get_impacted_tiles.
+    """
+    level = spell.caster.level
+    damage = spell.get_stat("damage") if damage_type is not None else None
+
+    weights = get_hostile_weights(level, spell.caster, damage, damage_type)
+    castable = get_castable_grid(spell)
+
+    if hasattr(spell, "get_heatmap"):
+        return spell.get_heatmap(weights, castable)
+
+    return get_impacted_heatmap(spell, weights, castable)
 
 def get_perp_point_slope(source, dx, dy, length, direction):
     longer_len = max(abs(dy), abs(dx))
@@ -137,14 +1344,7 @@ def get_perp_point(source, dest, length, direction):
     return Point(round(source.x + dy * length * direction), round(source.y - dx * length * direction))
 
 def has_adjacent_wall(level, x, y):
-    for point in level.get_adjacent_points(Point(x, y), filter_walkable = False):
-        if level.tiles[point.x][point.y].is_wall():
-            return True
-    return False
+    return bool(get_terrain_grids(level).adjacent_wall[x, y])
 
 def has_adjacent_chasm(level, x, y):
-    for point in level.get_adjacent_points(Point(x, y), filter_walkable = False):
-        tile = level.tiles[point.x][point.y]
-        if tile.is_chasm:
-            return True
-    return False
\ No newline at end of file
+    return bool(get_terrain_grids(level).adjacent_chasm[x, y])
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Checks get_multi_burst against the engine's Burst on walled levels, without launching the game.
+
+For random sets of sources, with shared and mixed radii, every point a separate Burst from any
+source reaches must be in get_multi_burst's result with the lowest stage it was reached at, no
+other point may be, and points must come in stage order. Walls block both the same way unless
+ignore_walls is set.
+
+Usage, from the repository root:
+    python -m bench.bursts                        # check against the stand-in engine in bench/engine
+    python -m bench.bursts --engine PATH          # check against the game's own Level.py in PATH
+"""
+
+import argparse
+import random
+import sys
+
+from bench.harness import load_cradle, make_level, ENGINE_DIR
+
+def get_expected(level, sources, ignore_walls):
+    from Level import Burst, Point
+
+    expected = {}
+    for source, radius in sources:
+        for stage, points in enumerate(Burst(level, source, radius, ignore_walls=ignore_walls)):
+            for point in points:
+                point = Point(point.x, point.y)
+                expected[point] = min(stage, expected.get(point, stage))
+
+    return expected
+
+def check(level, sources, ignore_walls, mixed):
+    """
+    Returns a description of the first mismatch, or None if get_multi_burst matches.
+    """
+    from mods.Cradle.Util import get_multi_burst
+
+    expected = get_expected(level, sources, ignore_walls)
+    if mixed:
+        actual = get_multi_burst(level, sources, ignore_walls=ignore_walls)
+    else:
+        actual = get_multi_burst(level, [source for source, radius in sources], sources[0][1], ignore_walls=ignore_walls)
+
+    stages = list(actual.values())
+    if stages != sorted(stages):
+        return "points are not in stage order"
+
+    for point in expected.keys() - actual.keys():
+        return "missing %s, reached at stage %d" % (point, expected[point])
+    for point in actual.keys() - expected.keys():
+        return "extra %s at stage %d" % (point, actual[point])
+    for point, stage in expected.items():
+        if actual[point] != stage:
+            return "%s at stage %d instead of %d" % (point, actual[point], stage)
+
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check get_multi_burst against the engine's Burst.")
+    parser.add_argument("--engine", default=ENGINE_DIR, help="directory to load Level.py from")
+    parser.add_argument("--seeds", type=int, default=20, help="number of levels to check")
+    args = parser.parse_args(argv)
+
+    load_cradle(args.engine)
+    from Level import Point
+
+    failures = 0
+    checks = 0
+    for seed in range(args.seeds):
+        rng = random.Random(seed)
+        level, wizard = make_level(24, 24, 0.05, wall_density=0.25, seed=seed)
+
+        for i in range(10):
+            mixed = i % 2 == 1
+            radius = rng.randint(1, 4)
+            sources = []
+            for j in range(rng.randint(1, 8)):
+                source = Point(rng.randrange(1, level.width - 1), rng.randrange(1, level.height - 1))
+                sources.append((source, rng.randint(0, 5) if mixed else radius))
+
+            for ignore_walls in (False, True):
+                checks += 1
+                mismatch = check(level, sources, ignore_walls, mixed)
+                if mismatch:
+                    failures += 1
+                    print("seed %d, sources %s, ignore_walls=%s: %s" % (seed, sources, ignore_walls, mismatch))
+
+    print("%d of %d checks matched" % (checks - failures, checks))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Stand-in for Rift Wizard's CommonContent module.
+"""
+
+from Level import Tags, Buff, Cloud, STACK_INTENSITY, BUFF_TYPE_CURSE
+from Spells import Spell
+
+class SimpleMeleeAttack(Spell):
+    def __init__(self, damage=1, damage_type=Tags.Physical):
+        Spell.__init__(self)
+        self.name = "Melee Attack"
+        self.damage = damage
+        self.damage_type = damage_type
+        self.range = 1.5
+        self.melee = True
+        self.requires_los = False
+
+    def cast_instant(self, x, y):
+        self.caster.level.deal_damage(x, y, self.get_stat("damage"), self.damage_type, self)
+
+class SimpleRangedAttack(Spell):
+    def __init__(self, name="Bolt", damage=1, damage_type=Tags.Fire, range=5):
+        Spell.__init__(self)
+        self.name = name
+        self.damage = damage
+        self.damage_type = damage_type
+        self.range = range
+        self.cool_down = 3
+
+    def cast_instant(self, x, y):
+        self.caster.level.deal_damage(x, y, self.get_stat("damage"), self.damage_type, self)
+
+class Poison(Buff):
+    def on_init(self):
+        self.name = "Poison"
+        self.buff_type = BUFF_TYPE_CURSE
+
+    def on_advance(self):
+        self.owner.deal_damage(1, Tags.Poison, self)
+
+class _DamageCloud(Cloud):
+    damage_type = None
+
+    def __init__(self, owner=None, damage=5):
+        Cloud.__init__(self)
+        self.owner = owner
+        self.damage = damage
+        self.duration = 5
+
+    def on_advance(self):
+        self.level.deal_damage(self.x, self.y, self.damage, self.damage_type, self)
+
+class FireCloud(_DamageCloud):
+    damage_type = Tags.Fire
+
+class BlizzardCloud(_DamageCloud):
+    damage_type = Tags.Ice
+
+class StormCloud(_DamageCloud):
+    damage_type = Tags.Lightning
+
+def apply_minion_bonuses(spell, unit):
+    pass
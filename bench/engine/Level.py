@@ -0,0 +1,612 @@
+"""
+A small stand-in for Rift Wizard's Level module, covering only the parts Cradle uses.
+Behaviour follows the game closely enough for timing and for checking that optimizations
+don't change results, but it is not a replacement for playing the game.
+"""
+
+from collections import namedtuple, defaultdict
+import math
+
+Point = namedtuple("Point", "x y")
+
+def distance(p1, p2, diag=False, euclidean=True):
+    if diag:
+        return max(abs(p1.x - p2.x), abs(p1.y - p2.y))
+    return math.sqrt((p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2)
+
+class Color:
+    def __init__(self, r=0, g=0, b=0):
+        self.r = r
+        self.g = g
+        self.b = b
+
+class Tag:
+    def __init__(self, name, color, asset=None):
+        self.name = name
+        self.color = color
+        self.asset = asset
+
+    def __repr__(self):
+        return self.name
+
+class _Tags:
+    def __init__(self):
+        self.elements = []
+
+    def __getattr__(self, name):
+        tag = Tag(name, Color())
+        setattr(self, name, tag)
+        return tag
+
+Tags = _Tags()
+for _name in ["Fire", "Ice", "Lightning", "Holy", "Dark", "Arcane", "Poison", "Physical", "Heal",
+              "Nature", "Enchantment", "Sorcery", "Conjuration", "Undead", "Metallic", "Living", "Pure"]:
+    getattr(Tags, _name)
+
+TEAM_PLAYER = 0
+TEAM_ENEMY = 1
+
+BUFF_TYPE_NONE = 0
+BUFF_TYPE_BLESS = 1
+BUFF_TYPE_CURSE = 2
+
+STACK_NONE = 0
+STACK_DURATION = 1
+STACK_INTENSITY = 2
+STACK_REPLACE = 3
+
+EventOnUnitAdded = namedtuple("EventOnUnitAdded", "unit")
+EventOnUnitPreAdded = namedtuple("EventOnUnitPreAdded", "unit")
+EventOnDeath = namedtuple("EventOnDeath", "unit damage_event")
+EventOnDamaged = namedtuple("EventOnDamaged", "unit damage damage_type source")
+EventOnPreDamaged = namedtuple("EventOnPreDamaged", "unit damage damage_type source")
+EventOnHealed = namedtuple("EventOnHealed", "unit heal source")
+EventOnBuffApply = namedtuple("EventOnBuffApply", "buff unit")
+EventOnBuffRemove = namedtuple("EventOnBuffRemove", "buff unit")
+EventOnSpellCast = namedtuple("EventOnSpellCast", "spell caster x y")
+EventOnMoved = namedtuple("EventOnMoved", "unit x y teleport")
+
+def are_hostile(unit1, unit2):
+    return unit1.team != unit2.team
+
+class EventHandler:
+    def __init__(self):
+        self._handlers = defaultdict(lambda: defaultdict(list))
+
+    def register_global_trigger(self, event_type, trigger):
+        self._handlers[event_type][None].append(trigger)
+
+    def register_entity_trigger(self, event_type, entity, trigger):
+        self._handlers[event_type][entity].append(trigger)
+
+    def unregister_global_trigger(self, event_type, trigger):
+        self._handlers[event_type][None].remove(trigger)
+
+    def unregister_entity_trigger(self, event_type, entity, trigger):
+        self._handlers[event_type][entity].remove(trigger)
+
+    def raise_event(self, event, entity=None):
+        handlers = self._handlers[type(event)]
+        if entity is not None:
+            for handler in list(handlers[entity]):
+                handler(event)
+        for handler in list(handlers[None]):
+            handler(event)
+
+class Tile:
+    def __init__(self, x, y, char='.'):
+        self.x = x
+        self.y = y
+        self.unit = None
+        self.cloud = None
+        self.prop = None
+        self.set_char(char)
+
+    def set_char(self, char):
+        self.char = char
+        self.is_chasm = char == ' '
+        self.can_walk = char == '.'
+        self.can_see = char != '#'
+        self.can_fly = char != '#'
+
+    def is_wall(self):
+        return self.char == '#'
+
+    def is_floor(self):
+        return self.char == '.'
+
+class Sprite:
+    def __init__(self):
+        self.char = '?'
+        self.color = Color()
+
+class Buff:
+    def __init__(self):
+        self.name = None
+        self.description = None
+        self.owner = None
+        self.turns_left = 0
+        self.buff_type = BUFF_TYPE_NONE
+        self.stack_type = STACK_DURATION
+        self.owner_triggers = {}
+        self.global_triggers = {}
+        self.applied = False
+        self.on_init()
+
+    def on_init(self):
+        pass
+
+    def on_applied(self, owner):
+        pass
+
+    def on_unapplied(self):
+        pass
+
+    def on_advance(self):
+        pass
+
+    def apply(self, owner):
+        self.owner = owner
+        self.applied = True
+        owner.buffs.append(self)
+        self.subscribe()
+        self.on_applied(owner)
+
+    def subscribe(self):
+        event_manager = self.owner.level.event_manager
+        for event_type, trigger in self.owner_triggers.items():
+            event_manager.register_entity_trigger(event_type, self.owner, trigger)
+        for event_type, trigger in self.global_triggers.items():
+            event_manager.register_global_trigger(event_type, trigger)
+
+    def unsubscribe(self):
+        event_manager = self.owner.level.event_manager
+        for event_type, trigger in self.owner_triggers.items():
+            event_manager.unregister_entity_trigger(event_type, self.owner, trigger)
+        for event_type, trigger in self.global_triggers.items():
+            event_manager.unregister_global_trigger(event_type, trigger)
+
+    def unapply(self):
+        self.unsubscribe()
+        self.applied = False
+        self.on_unapplied()
+
+    def advance(self):
+        self.on_advance()
+        if self.turns_left > 0:
+            self.turns_left -= 1
+            if self.turns_left == 0 and self.applied:
+                self.owner.remove_buff(self)
+
+class ChannelBuff(Buff):
+    def __init__(self, spell, target):
+        Buff.__init__(self)
+        self.spell = spell
+        self.target = target
+
+class Cloud:
+    def __init__(self):
+        self.owner = None
+        self.duration = 1
+        self.name = "Cloud"
+        self.description = ""
+        self.color = Color()
+        self.asset_name = None
+        self.level = None
+        self.x = 0
+        self.y = 0
+        self.killed = False
+
+    def on_advance(self):
+        pass
+
+    def on_expire(self):
+        pass
+
+    def advance(self):
+        self.on_advance()
+        self.duration -= 1
+        if self.duration <= 0 and not self.killed:
+            self.kill()
+
+    def kill(self):
+        if self.killed:
+            return
+        self.killed = True
+        self.level.remove_obj(self)
+        self.on_expire()
+
+class Prop:
+    def __init__(self):
+        self.name = "Prop"
+        self.level = None
+        self.x = 0
+        self.y = 0
+
+    def advance(self):
+        pass
+
+class Unit:
+    def __init__(self):
+        self.name = "Unit"
+        self.tags = []
+        self.spells = []
+        self.buffs = []
+        self.resists = defaultdict(int)
+        self.max_hp = 10
+        self.cur_hp = 0
+        self.shields = 0
+        self.team = TEAM_ENEMY
+        self.level = None
+        self.x = 0
+        self.y = 0
+        self.cool_downs = {}
+        self.killed = False
+        self.xp = 0
+        self.turns_to_death = None
+        self.stationary = False
+        self.flying = False
+        self.source = None
+        self.sprite = Sprite()
+        self.asset = None
+        self.is_player_controlled = False
+
+    def is_alive(self):
+        return self.cur_hp > 0 and not self.killed
+
+    def has_buff(self, buff_class):
+        return any(isinstance(buff, buff_class) for buff in self.buffs)
+
+    def get_buff(self, buff_class):
+        for buff in self.buffs:
+            if isinstance(buff, buff_class):
+                return buff
+        return None
+
+    def apply_buff(self, buff, duration=0):
+        if buff.stack_type == STACK_NONE:
+            existing = self.get_buff(type(buff))
+            if existing is not None:
+                existing.turns_left = max(existing.turns_left, duration)
+                return
+
+        buff.turns_left = duration
+        buff.apply(self)
+        self.level.event_manager.raise_event(EventOnBuffApply(buff, self), self)
+
+    def remove_buff(self, buff):
+        if buff not in self.buffs:
+            return
+        self.buffs.remove(buff)
+        buff.unapply()
+        self.level.event_manager.raise_event(EventOnBuffRemove(buff, self), self)
+
+    def remove_buffs(self, buff_class):
+        for buff in [b for b in self.buffs if isinstance(b, buff_class)]:
+            self.remove_buff(buff)
+
+    def deal_damage(self, amount, damage_type, source):
+        return self.level.deal_damage(self.x, self.y, amount, damage_type, source)
+
+    def kill(self, damage_event=None):
+        if self.killed:
+            return
+        self.killed = True
+        self.cur_hp = 0
+        self.level.event_manager.raise_event(EventOnDeath(self, damage_event), self)
+        for buff in list(self.buffs):
+            self.remove_buff(buff)
+        self.level.remove_obj(self)
+
+    def act(self):
+        # A very small AI: use the first ready spell on the closest hostile it can reach
+        for spell in self.spells:
+            if self.cool_downs.get(spell, 0) > 0:
+                continue
+
+            spell_range = spell.get_stat("range") + 0.5
+            targets = [u for u in self.level.units
+                       if are_hostile(self, u) and abs(u.x - self.x) <= spell_range and abs(u.y - self.y) <= spell_range]
+
+            for target in sorted(targets, key=lambda u: distance(u, self)):
+                if spell.can_cast(target.x, target.y):
+                    self.level.act_cast(self, spell, target.x, target.y)
+                    self.cool_downs[spell] = getattr(spell, "cool_down", 0)
+                    return
+
+    def advance(self):
+        if not self.is_player_controlled:
+            self.act()
+
+        for spell in list(self.cool_downs):
+            self.cool_downs[spell] = max(0, self.cool_downs[spell] - 1)
+        for buff in list(self.buffs):
+            if not self.is_alive():
+                break
+            buff.advance()
+        if self.turns_to_death is not None and self.is_alive():
+            self.turns_to_death -= 1
+            if self.turns_to_death <= 0:
+                self.kill()
+
+class Spell:
+    def __init__(self):
+        self.name = "Spell"
+        self.level = 0
+        self.tags = []
+        self.max_charges = 0
+        self.cur_charges = 0
+        self.range = 0
+        self.radius = 0
+        self.damage = 0
+        self.duration = 0
+        self.requires_los = True
+        self.must_target_empty = False
+        self.melee = False
+        self.caster = None
+        self.owner = None
+        self.statholder = None
+        self.upgrades = {}
+        self.description = ""
+        self.on_init()
+        self.cur_charges = self.max_charges
+
+    def on_init(self):
+        pass
+
+    def get_description(self):
+        return self.description
+
+    def get_stat(self, attr, base=None):
+        if base is None:
+            base = getattr(self, attr, 0)
+        return base
+
+    def fmt_dict(self):
+        return {attr: value for attr, value in self.__dict__.items() if isinstance(value, (int, float, str))}
+
+    def can_cast(self, x, y):
+        if distance(Point(x, y), Point(self.caster.x, self.caster.y)) > self.get_stat("range") + 0.5:
+            return False
+        if self.get_stat("requires_los") and not self.caster.level.can_see(self.caster.x, self.caster.y, x, y):
+            return False
+        return True
+
+    def get_impacted_tiles(self, x, y):
+        return [Point(x, y)]
+
+    def cast_instant(self, x, y):
+        pass
+
+    def cast(self, x, y):
+        self.cast_instant(x, y)
+        yield
+
+    def summon(self, unit, target=None, radius=3, team=None, sort_dist=True):
+        if target is None:
+            target = Point(self.caster.x, self.caster.y)
+        unit.team = self.caster.team if team is None else team
+        unit.source = self
+        level = self.caster.level
+        for point in [target] + level.get_adjacent_points(target):
+            if level.tiles[point.x][point.y].unit is None and level.tiles[point.x][point.y].can_walk:
+                level.add_obj(unit, point.x, point.y)
+                return unit
+        return None
+
+class Burst:
+    def __init__(self, level, origin, radius, burst_cone_params=None, expand_diagonals=False, ignore_walls=False):
+        self.level = level
+        self.origin = Point(origin.x, origin.y)
+        self.radius = radius
+        self.ignore_walls = ignore_walls
+
+    def __iter__(self):
+        already_exploded = set([self.origin])
+        last_stage = set([self.origin])
+        yield last_stage
+
+        for i in range(self.radius):
+            next_stage = set()
+            for point in last_stage:
+                next_stage.update(self.level.get_adjacent_points(point, filter_walkable=False))
+
+            next_stage.difference_update(already_exploded)
+
+            if not self.ignore_walls:
+                next_stage = set(p for p in next_stage if not self.level.tiles[p.x][p.y].is_wall())
+
+            already_exploded.update(next_stage)
+            if not next_stage:
+                return
+
+            yield next_stage
+            last_stage = next_stage
+
+class Level:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.tiles = [[Tile(x, y) for y in range(height)] for x in range(width)]
+        self.units = []
+        self.clouds = []
+        self.props = []
+        self.event_manager = EventHandler()
+        self.turn_no = 0
+        self.effects_shown = 0
+
+    def is_point_in_bounds(self, point):
+        return 0 <= point.x < self.width and 0 <= point.y < self.height
+
+    def make_wall(self, x, y, calc_glyph=True):
+        self.tiles[x][y].set_char('#')
+
+    def make_floor(self, x, y, calc_glyph=True):
+        self.tiles[x][y].set_char('.')
+
+    def make_chasm(self, x, y, calc_glyph=True):
+        self.tiles[x][y].set_char(' ')
+
+    def get_unit_at(self, x, y):
+        return self.tiles[x][y].unit
+
+    def get_adjacent_points(self, point, filter_walkable=True, check_unit=False):
+        points = []
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                if dx == 0 and dy == 0:
+                    continue
+                p = Point(point.x + dx, point.y + dy)
+                if not self.is_point_in_bounds(p):
+                    continue
+                if filter_walkable and not self.tiles[p.x][p.y].can_walk:
+                    continue
+                if check_unit and self.tiles[p.x][p.y].unit is not None:
+                    continue
+                points.append(p)
+        return points
+
+    def get_points_in_line(self, start, end, two_pass=True, find_clear=False):
+        x0, y0, x1, y1 = start.x, start.y, end.x, end.y
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+
+        points = []
+        while True:
+            points.append(Point(x0, y0))
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+        if find_clear:
+            for point in points[1:-1]:
+                if not self.tiles[point.x][point.y].can_see:
+                    return []
+        return points
+
+    def can_see(self, x1, y1, x2, y2, light_walls=False):
+        for point in self.get_points_in_line(Point(x1, y1), Point(x2, y2))[1:-1]:
+            if not self.tiles[point.x][point.y].can_see:
+                return False
+        return True
+
+    def get_units_in_los(self, point):
+        return [u for u in self.units if self.can_see(point.x, point.y, u.x, u.y)]
+
+    def show_effect(self, x, y, damage_type, color=None, minor=False):
+        self.effects_shown += 1
+
+    def add_obj(self, obj, x, y):
+        obj.x = x
+        obj.y = y
+        obj.level = self
+
+        if isinstance(obj, Unit):
+            if obj.cur_hp <= 0:
+                obj.cur_hp = obj.max_hp
+            for spell in obj.spells:
+                spell.caster = obj
+                spell.owner = obj
+            self.tiles[x][y].unit = obj
+            self.units.append(obj)
+            self.event_manager.raise_event(EventOnUnitAdded(obj), obj)
+        elif isinstance(obj, Cloud):
+            existing = self.tiles[x][y].cloud
+            if existing is not None:
+                existing.kill()
+            self.tiles[x][y].cloud = obj
+            self.clouds.append(obj)
+        else:
+            existing = self.tiles[x][y].prop
+            if existing is not None:
+                self.remove_obj(existing)
+            self.tiles[x][y].prop = obj
+            self.props.append(obj)
+
+    def remove_obj(self, obj):
+        if isinstance(obj, Unit):
+            if obj in self.units:
+                self.units.remove(obj)
+            if self.tiles[obj.x][obj.y].unit is obj:
+                self.tiles[obj.x][obj.y].unit = None
+        elif isinstance(obj, Cloud):
+            if obj in self.clouds:
+                self.clouds.remove(obj)
+            if self.tiles[obj.x][obj.y].cloud is obj:
+                self.tiles[obj.x][obj.y].cloud = None
+        else:
+            if obj in self.props:
+                self.props.remove(obj)
+            if self.tiles[obj.x][obj.y].prop is obj:
+                self.tiles[obj.x][obj.y].prop = None
+
+    def act_move(self, unit, x, y, teleport=False, leap=False, force_swap=False):
+        self.tiles[unit.x][unit.y].unit = None
+        unit.x = x
+        unit.y = y
+        self.tiles[x][y].unit = unit
+        self.event_manager.raise_event(EventOnMoved(unit, x, y, teleport), unit)
+
+    def deal_damage(self, x, y, amount, damage_type, source, flash=True):
+        self.show_effect(x, y, damage_type)
+
+        unit = self.get_unit_at(x, y)
+        if unit is None or not unit.is_alive():
+            return 0
+
+        if amount < 0 and damage_type == Tags.Heal:
+            heal = min(-amount, unit.max_hp - unit.cur_hp)
+            unit.cur_hp += heal
+            self.event_manager.raise_event(EventOnHealed(unit, heal, source), unit)
+            return -heal
+
+        resist = min(100, unit.resists[damage_type])
+        amount = int(math.ceil(amount * (100 - resist) / 100))
+        if amount <= 0:
+            return 0
+
+        self.event_manager.raise_event(EventOnPreDamaged(unit, amount, damage_type, source), unit)
+
+        if unit.shields > 0:
+            unit.shields -= 1
+            return 0
+
+        amount = min(amount, unit.cur_hp)
+        unit.cur_hp -= amount
+
+        damage_event = EventOnDamaged(unit, amount, damage_type, source)
+        self.event_manager.raise_event(damage_event, unit)
+
+        if unit.cur_hp <= 0:
+            unit.kill(damage_event)
+
+        return amount
+
+    def act_cast(self, unit, spell, x, y, pay_costs=True):
+        if spell.caster is None:
+            spell.caster = unit
+        self.event_manager.raise_event(EventOnSpellCast(spell, unit, x, y), unit)
+        for _ in spell.cast(x, y):
+            pass
+
+    def advance(self):
+        for unit in list(self.units):
+            if unit.is_alive():
+                unit.advance()
+
+        for prop in list(self.props):
+            prop.advance()
+
+        for cloud in list(self.clouds):
+            cloud.advance()
+
+        self.turn_no += 1
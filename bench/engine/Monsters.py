@@ -0,0 +1,34 @@
+"""
+Stand-in for Rift Wizard's Monsters module.
+"""
+
+from Level import Tags, Unit
+from Spells import Spell
+from CommonContent import SimpleMeleeAttack
+
+class MordredCorruption(Spell):
+    def on_init(self):
+        self.name = "Corruption"
+
+def _ghost(name, hp):
+    unit = Unit()
+    unit.name = name
+    unit.max_hp = hp
+    unit.tags = [Tags.Undead, Tags.Dark]
+    unit.spells.append(SimpleMeleeAttack(2, Tags.Dark))
+    return unit
+
+def Ghost():
+    return _ghost("Ghost", 4)
+
+def GhostMass():
+    return _ghost("Ghost Mass", 20)
+
+def GhostKing():
+    return _ghost("Ghost King", 30)
+
+def GhostFire():
+    return _ghost("Burning Ghost", 4)
+
+def Bloodghast():
+    return _ghost("Bloodghast", 6)
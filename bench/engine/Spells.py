@@ -0,0 +1,13 @@
+"""
+Stand-in for Rift Wizard's Spells module.
+"""
+
+from Level import Tags, Point, Cloud, Spell, distance
+
+all_player_spell_constructors = []
+
+class InfernoCloud(Cloud):
+    def __init__(self, owner=None):
+        Cloud.__init__(self)
+        self.owner = owner
+        self.name = "Inferno"
@@ -0,0 +1,22 @@
+"""
+Stand-in for Rift Wizard's Upgrades module.
+"""
+
+from Level import Buff
+
+skill_constructors = []
+
+class Upgrade(Buff):
+    def __init__(self):
+        self.level = 0
+        self.tags = []
+        self.asset = None
+        Buff.__init__(self)
+
+    def get_stat(self, attr, base=None):
+        if base is None:
+            base = getattr(self, attr, 0)
+        return base
+
+    def fmt_dict(self):
+        return {attr: value for attr, value in self.__dict__.items() if isinstance(value, (int, float, str))}
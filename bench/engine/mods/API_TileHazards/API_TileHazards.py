@@ -0,0 +1,24 @@
+"""
+Stand-in for the API_TileHazards mod.
+"""
+
+from Level import Prop
+
+class TileHazardBasic(Prop):
+    def __init__(self, name, duration, user):
+        Prop.__init__(self)
+        self.name = name
+        self.duration = duration
+        self.user = user
+
+    def effect(self, unit):
+        pass
+
+    def advance_effect(self):
+        pass
+
+    def advance(self):
+        self.advance_effect()
+        self.duration -= 1
+        if self.duration <= 0:
+            self.level.remove_obj(self)
@@ -0,0 +1,180 @@
+"""
+Loads Cradle against the stand-in engine in bench/engine and builds synthetic levels for it.
+"""
+
+import importlib
+import os
+import random
+import sys
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_DIR = os.path.join(BENCH_DIR, "engine")
+CRADLE_DIR = os.path.dirname(BENCH_DIR)
+
+def load_cradle(engine_dir=ENGINE_DIR):
+    """
+    Makes the stand-in engine importable and registers this repository as mods.Cradle.
+    Returns the Level module so callers can build units and levels.
+
+    engine_dir: load the engine from here instead, such as the game's own directory.
+    """
+    if engine_dir not in sys.path:
+        sys.path.insert(0, engine_dir)
+
+    if "mods" not in sys.modules:
+        mods = types.ModuleType("mods")
+        mods.__path__ = [os.path.join(engine_dir, "mods")]
+        sys.modules["mods"] = mods
+
+    if "mods.Cradle" not in sys.modules:
+        cradle = types.ModuleType("mods.Cradle")
+        cradle.__path__ = [CRADLE_DIR]
+        sys.modules["mods.Cradle"] = cradle
+        sys.modules["mods"].Cradle = cradle
+
+    Level = importlib.import_module("Level")
+
+    for module in ["Util", "Pure", "Tilehazards", "spells.TwinStars", "spells.HollowKing", "Upgrades"]:
+        importlib.import_module("mods.Cradle." + module)
+
+    return Level
+
+def make_level(width=28, height=28, unit_density=0.05, wall_density=0.08, chasm_density=0.03, seed=0):
+    """
+    Builds a walled level with scattered walls and chasms, a player wizard in the middle,
+    and enemies and friendly minions placed at the given density.
+    Returns the level and the wizard.
+    """
+    from Level import Level, Unit, Tags, TEAM_PLAYER, TEAM_ENEMY
+    from CommonContent import SimpleMeleeAttack, SimpleRangedAttack
+
+    rng = random.Random(seed)
+    level = Level(width, height)
+
+    center = (width // 2, height // 2)
+
+    for x in range(width):
+        for y in range(height):
+            if x in (0, width - 1) or y in (0, height - 1):
+                level.make_wall(x, y)
+                continue
+            if abs(x - center[0]) <= 1 and abs(y - center[1]) <= 1:
+                continue
+
+            roll = rng.random()
+            if roll < wall_density:
+                level.make_wall(x, y)
+            elif roll < wall_density + chasm_density:
+                level.make_chasm(x, y)
+
+    wizard = Unit()
+    wizard.name = "Wizard"
+    wizard.team = TEAM_PLAYER
+    wizard.max_hp = 1000
+    wizard.is_player_controlled = True
+    level.add_obj(wizard, *center)
+
+    for x in range(1, width - 1):
+        for y in range(1, height - 1):
+            if not level.tiles[x][y].is_floor() or level.tiles[x][y].unit is not None:
+                continue
+            if rng.random() >= unit_density:
+                continue
+
+            unit = Unit()
+            unit.max_hp = 60
+
+            if rng.random() < 0.25:
+                unit.name = "Minion"
+                unit.team = TEAM_PLAYER
+                unit.tags = [rng.choice([Tags.Holy, Tags.Undead, Tags.Metallic, Tags.Living])]
+                unit.spells.append(SimpleMeleeAttack(5))
+            else:
+                unit.name = "Enemy"
+                unit.team = TEAM_ENEMY
+                unit.tags = [rng.choice([Tags.Living, Tags.Metallic, Tags.Dark, Tags.Nature])]
+                unit.spells.append(SimpleMeleeAttack(4))
+                unit.spells.append(SimpleRangedAttack(damage=3))
+
+            level.add_obj(unit, x, y)
+
+    return level, wizard
+
+def find_target(spell, level):
+    """
+    Picks a target the way a player would: the caster for self-targeted spells, otherwise the
+    closest unit the spell can be cast on, otherwise the closest tile it can be cast on.
+    """
+    from Level import Point, distance
+
+    caster = spell.caster
+    if spell.get_stat("range") == 0:
+        return Point(caster.x, caster.y)
+
+    if not spell.must_target_empty:
+        units = sorted((u for u in level.units if u is not caster), key=lambda u: distance(u, caster))
+        for unit in units:
+            if spell.can_cast(unit.x, unit.y):
+                return Point(unit.x, unit.y)
+
+    points = sorted((Point(x, y) for x in range(level.width) for y in range(level.height)),
+                    key=lambda p: distance(p, caster))
+    for point in points:
+        if point == Point(caster.x, caster.y):
+            continue
+        if spell.must_target_empty and level.tiles[point.x][point.y].unit is not None:
+            continue
+        if level.tiles[point.x][point.y].is_floor() and spell.can_cast(point.x, point.y):
+            return point
+
+    return None
+
+def apply_all_upgrades(spell):
+    for attr, upgrade in spell.upgrades.items():
+        setattr(spell, attr, getattr(spell, attr, 0) + upgrade[0])
+
+def afflict(level, wizard, seed=0):
+    """
+    Purifies half of the enemies, poisons a third of them and covers a patch around the
+    wizard in mana clouds, so that every Cradle upgrade has something to react to.
+    """
+    from Level import Point, are_hostile
+    from CommonContent import Poison
+    from mods.Cradle.Pure import PureBuff, PureCloud
+
+    rng = random.Random(seed)
+
+    for unit in list(level.units):
+        if not are_hostile(unit, wizard):
+            continue
+        if rng.random() < 0.5:
+            unit.apply_buff(PureBuff(), 20)
+        if rng.random() < 0.33:
+            unit.apply_buff(Poison(), 20)
+
+    for x in range(wizard.x - 5, wizard.x + 6):
+        for y in range(wizard.y - 5, wizard.y + 6):
+            if level.is_point_in_bounds(Point(x, y)) and level.tiles[x][y].is_floor():
+                level.add_obj(PureCloud(wizard, 6), x, y)
+
+def elemental_volley(level, wizard, rng, hits=4):
+    """
+    Has the wizard hit random enemies with fire, ice, lightning and pure damage, the damage
+    types Cradle's upgrades listen for.
+    """
+    from Level import Tags, are_hostile
+    from Spells import Spell
+
+    source = Spell()
+    source.caster = wizard
+    source.owner = wizard
+
+    enemies = [u for u in level.units if are_hostile(u, wizard)]
+    if not enemies:
+        return
+
+    for damage_type in [Tags.Fire, Tags.Ice, Tags.Lightning, Tags.Pure]:
+        for target in rng.sample(enemies, min(hits, len(enemies))):
+            if target.is_alive():
+                level.deal_damage(target.x, target.y, 5, damage_type, source)
@@ -0,0 +1,198 @@
+"""
+Times Cradle's spells and upgrades on synthetic levels, without launching the game.
+
+Each spell in spells/TwinStars.py and spells/HollowKing.py is previewed and cast, with and
+without its upgrades. Each upgrade in Upgrades.py is given to a wizard on a level full of
+purified, poisoned and cloud-covered enemies, and the level is advanced for a number of turns.
+Results are compared with bench/baseline.json and the run fails if any case got slower or
+uses more memory than the baseline allows.
+
+Usage, from the repository root:
+    python -m bench.run                       # run and compare against the baseline
+    python -m bench.run --update-baseline     # run and store the results as the new baseline
+    python -m bench.run --size 60 --density 0.15 --filter "Mana"
+
+Timings depend on the machine, so regenerate the baseline before comparing on a new one.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from bench.harness import load_cradle, make_level, find_target, apply_all_upgrades, afflict, elemental_volley, BENCH_DIR
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+def get_spell_cases():
+    import mods.Cradle.spells.TwinStars as TwinStars
+    import mods.Cradle.spells.HollowKing as HollowKing
+    from Spells import all_player_spell_constructors
+
+    # Only spells the player can learn; minion spells like Shred are run by the turn cases
+    modules = [TwinStars.__name__, HollowKing.__name__]
+    return [cls for cls in all_player_spell_constructors if cls.__module__ in modules]
+
+def get_upgrade_cases():
+    import mods.Cradle.Upgrades as Upgrades
+    from Upgrades import skill_constructors
+
+    return [cls for cls in skill_constructors if cls.__module__ == Upgrades.__name__]
+
+def measure(func, repeat):
+    """
+    Runs func repeat times and returns the best time in milliseconds, then runs it once more
+    under tracemalloc and returns the peak memory it allocated in KiB and the number of
+    blocks still allocated afterwards.
+    """
+    times = []
+    for i in range(repeat):
+        state = func.setup()
+        gc.collect()
+        start = time.perf_counter()
+        func(state)
+        times.append((time.perf_counter() - start) * 1000)
+
+    state = func.setup()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(state)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    return {"ms": round(min(times), 3), "peak_kib": round(peak / 1024, 1), "blocks": blocks}
+
+class SpellCast:
+    def __init__(self, spell_class, args, upgraded):
+        self.spell_class = spell_class
+        self.args = args
+        self.upgraded = upgraded
+
+    def setup(self):
+        level, wizard = make_level(self.args.size, self.args.size, self.args.density, seed=self.args.seed)
+        spell = self.spell_class()
+        spell.caster = wizard
+        spell.owner = wizard
+        if self.upgraded:
+            apply_all_upgrades(spell)
+        return level, wizard, spell, find_target(spell, level)
+
+    def __call__(self, state):
+        level, wizard, spell, target = state
+        if target is None:
+            return
+
+        spell.get_impacted_tiles(target.x, target.y)
+        level.act_cast(wizard, spell, target.x, target.y)
+
+class UpgradeTurns:
+    def __init__(self, upgrade_classes, args):
+        self.upgrade_classes = upgrade_classes
+        self.args = args
+
+    def setup(self):
+        level, wizard = make_level(self.args.size, self.args.size, self.args.density, seed=self.args.seed)
+        for upgrade_class in self.upgrade_classes:
+            wizard.apply_buff(upgrade_class())
+        afflict(level, wizard, self.args.seed)
+        return level, wizard, random.Random(self.args.seed)
+
+    def __call__(self, state):
+        level, wizard, rng = state
+        for i in range(self.args.turns):
+            elemental_volley(level, wizard, rng)
+            level.advance()
+
+def run(args):
+    load_cradle()
+
+    cases = {}
+    for spell_class in get_spell_cases():
+        name = spell_class().name
+        cases["cast: " + name] = SpellCast(spell_class, args, False)
+        cases["cast: " + name + " (upgraded)"] = SpellCast(spell_class, args, True)
+
+    cases["turns: no upgrades"] = UpgradeTurns([], args)
+    for upgrade_class in get_upgrade_cases():
+        cases["turns: " + upgrade_class().name] = UpgradeTurns([upgrade_class], args)
+    cases["turns: all upgrades"] = UpgradeTurns(get_upgrade_cases(), args)
+
+    results = {}
+    for name, case in cases.items():
+        if args.filter and args.filter.lower() not in name.lower():
+            continue
+        results[name] = measure(case, args.repeat)
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a description of every case that is more than tolerance times slower, or uses
+    more than tolerance times the memory, of its baseline. Differences under a millisecond
+    or under 16 KiB are ignored as noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+
+        if result["ms"] > base["ms"] * tolerance and result["ms"] - base["ms"] > 1:
+            regressions.append(f"{name}: {base['ms']} ms -> {result['ms']} ms")
+        if result["peak_kib"] > base["peak_kib"] * tolerance and result["peak_kib"] - base["peak_kib"] > 16:
+            regressions.append(f"{name}: {base['peak_kib']} KiB -> {result['peak_kib']} KiB")
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Cradle spells and upgrades on a stand-in engine.")
+    parser.add_argument("--size", type=int, default=40, help="width and height of the synthetic level")
+    parser.add_argument("--density", type=float, default=0.08, help="chance of a unit on each floor tile")
+    parser.add_argument("--turns", type=int, default=10, help="turns to advance for each upgrade")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", default=None, help="only run cases whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown over the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}}  {'ms':>9}  {'base ms':>9}  {'peak KiB':>9}  {'blocks':>7}")
+    for name, result in results.items():
+        base_ms = baseline.get(name, {}).get("ms", "-")
+        print(f"{name:<{width}}  {result['ms']:>9}  {base_ms:>9}  {result['peak_kib']:>9}  {result['blocks']:>7}")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print("    " + regression)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Plays a fixed sequence of Cradle casts and turns on synthetic levels and prints a fingerprint
+of the resulting game state, without launching the game.
+
+Changes that are only meant to make things faster should leave the fingerprint unchanged, so
+run it before and after a change and compare. Units, their hp, cooldowns and buffs, clouds
+and props are fingerprinted after every cast and turn.
+
+Usage, from the repository root:
+    python -m bench.scenario              # print the fingerprint and the number of checkpoints
+    python -m bench.scenario --verbose    # also print every checkpoint
+"""
+
+import argparse
+import hashlib
+
+from bench.harness import load_cradle, make_level
+
+def get_spells():
+    import mods.Cradle.spells.TwinStars as TwinStars
+    import mods.Cradle.spells.HollowKing as HollowKing
+
+    return [
+        (TwinStars.HollowDomainSpell, {}),
+        (HollowKing.MadraPulseSpell, {"reflection": 2}),
+        (HollowKing.HollowSpearSpell, {"thunder_spear": 1, "barrage": 1}),
+        (HollowKing.SwordOfJudgment, {"radius": 2, "web_of_light": 1}),
+        (HollowKing.ManaBulletSpell, {}),
+        (TwinStars.WordOfEmptiness, {}),
+        (TwinStars.EmptyPalmSpell, {"cardinal projection": 1}),
+        (TwinStars.HelixBeam, {}),
+        (HollowKing.SevenStarsSpell, {"burning": 1}),
+        (TwinStars.SoulCloakSpell, {"resonance": 2}),
+        (TwinStars.ManaShredder, {}),
+        (TwinStars.SoulFormation, {}),
+    ]
+
+def get_upgrades():
+    import mods.Cradle.Upgrades as Upgrades
+
+    return [Upgrades.CleansingFlame, Upgrades.SpiritCorruption, Upgrades.FrozenMana, Upgrades.Nihilism,
+            Upgrades.Ozone, Upgrades.PermeatingLight, Upgrades.Mindlessness, Upgrades.ManaPrism]
+
+def fingerprint(level):
+    units = []
+    for unit in sorted(level.units, key=lambda unit: (unit.x, unit.y)):
+        buffs = tuple(sorted(type(buff).__name__ + str(buff.turns_left) for buff in unit.buffs))
+        units.append((unit.name, unit.x, unit.y, unit.cur_hp, tuple(sorted(unit.cool_downs.values())), buffs))
+
+    clouds = sorted((cloud.x, cloud.y, type(cloud).__name__, cloud.duration) for cloud in level.clouds)
+    props = sorted((prop.x, prop.y, prop.duration) for prop in level.props)
+
+    return hashlib.md5(repr((units, clouds, props)).encode()).hexdigest()[:10]
+
+def pick_target(spell_class, index, level, wizard):
+    from mods.Cradle.spells.TwinStars import SoulCloakSpell, EmptyPalmSpell, ManaShredder
+
+    x, y = wizard.x + (index * 3) % 7 - 3, wizard.y + (index * 5) % 9 - 4
+
+    # Soul Cloak targets an ally and Empty Palm an enemy
+    if spell_class in (SoulCloakSpell, EmptyPalmSpell):
+        candidates = [unit for unit in level.units
+                      if unit is not wizard and (unit.team == wizard.team) == (spell_class is SoulCloakSpell)]
+        if candidates:
+            x, y = candidates[0].x, candidates[0].y
+
+    # Mana Shredder summons next to the wizard
+    if spell_class is ManaShredder:
+        x, y = wizard.x + 1, wizard.y
+        if level.tiles[x][y].unit:
+            return None
+
+    return x, y
+
+def play(seed, checkpoints):
+    from CommonContent import Poison
+    from mods.Cradle.spells.TwinStars import ManaShredder
+
+    level, wizard = make_level(36, 36, 0.1, seed=seed)
+    for upgrade_class in get_upgrades():
+        wizard.apply_buff(upgrade_class())
+
+    for unit in list(level.units)[::4]:
+        if unit is not wizard:
+            unit.apply_buff(Poison(), 5)
+
+    for i, (spell_class, stats) in enumerate(get_spells()):
+        spell = spell_class()
+        spell.caster = wizard
+        for stat, value in stats.items():
+            setattr(spell, stat, value)
+
+        target = pick_target(spell_class, i, level, wizard)
+        if target is None:
+            continue
+        x, y = target
+
+        tiles = spell.get_impacted_tiles(x, y) if spell_class is not ManaShredder else []
+        checkpoints.append((spell_class.__name__, len(tiles), len(set(tiles))))
+
+        level.act_cast(wizard, spell, x, y)
+        level.advance()
+        checkpoints.append(fingerprint(level))
+
+    for i in range(6):
+        level.advance()
+        checkpoints.append(fingerprint(level))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint the game state after a fixed sequence of Cradle casts.")
+    parser.add_argument("--seeds", type=int, default=3, help="number of levels to play")
+    parser.add_argument("--verbose", action="store_true", help="print every checkpoint")
+    args = parser.parse_args(argv)
+
+    load_cradle()
+
+    checkpoints = []
+    for seed in range(args.seeds):
+        play(seed, checkpoints)
+
+    print(hashlib.md5(repr(checkpoints).encode()).hexdigest(), len(checkpoints))
+    if args.verbose:
+        for checkpoint in checkpoints:
+            print(checkpoint)
+
+if __name__ == "__main__":
+    main()
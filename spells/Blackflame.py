@@ -1,7 +1,9 @@
 from Spells import Spell, all_player_spell_constructors
-from Level import Buff, Tags, Burst, Point, ChannelBuff
+from Level import Buff, Tags, Point, ChannelBuff
 from Level import BUFF_TYPE_BLESS, STACK_NONE, EventOnDamaged
 
+from mods.Cradle.Util import get_burst, deal_damages, fast_forward
+
 import Monsters
 
 class VoidDragonDanceBuff(Buff):
@@ -29,8 +31,7 @@ class VoidDragonDanceBuff(Buff):
             return
         
         for unit in self.units:
-            unit.deal_damage(self.damage, Tags.Fire, self)
-            unit.deal_damage(self.damage, Tags.Dark, self)
+            deal_damages(self.owner.level, unit, [(self.damage, Tags.Fire), (self.damage, Tags.Dark)], self)
 
 class VoidDragonDanceSpell(Spell):
     def on_init(self):
@@ -48,10 +49,11 @@ class VoidDragonDanceSpell(Spell):
         #TODO: Add description
         return "Descriptionn"
 
+    @fast_forward
     def cast(self, x, y):
         units = []
 
-        for stage in Burst(self.caster.level, Point(x, y), self.get_stat("radius")):
+        for stage in get_burst(self.caster.level, Point(x, y), self.get_stat("radius")):
             for point in stage:
                 unit = self.caster.level.get_unit_at(point.x, point.y)
                 if unit and unit != self.caster:
@@ -90,6 +92,7 @@ class DragonsBreathSpell(Spell):
         path.remove(start)
         return path
 
+    @fast_forward
     def cast(self, x, y, channel_cast = False):
         if self.get_stat('channel') and not channel_cast:
             self.caster.apply_buff(ChannelBuff(self.cast, Point(x, y)), self.get_stat('max_channel'))
@@ -98,8 +101,8 @@ class DragonsBreathSpell(Spell):
         for point in self.get_impacted_tiles(x, y):
             if self.caster.level.tiles[point.x][point.y].is_wall():
                 self.caster.level.make_floor(point.x, point.y)
-            self.caster.level.deal_damage(point.x, point.y, self.get_stat('damage'), Tags.Fire, self)
-            self.caster.level.deal_damage(point.x, point.y, self.get_stat('damage'), Tags.Dark, self)
+            damage = self.get_stat('damage')
+            deal_damages(self.caster.level, point, [(damage, Tags.Fire), (damage, Tags.Dark)], self)
             yield
 
 all_player_spell_constructors.append(VoidDragonDanceSpell)
@@ -1,9 +1,10 @@
 from Spells import Spell, all_player_spell_constructors
-from Level import Tags, Point, Burst, TEAM_PLAYER
+from Level import Tags, Point, TEAM_PLAYER
 
-from mods.Cradle.Util import get_bouncing_line, get_bouncing_line_endpoints
+from mods.Cradle.Util import get_bouncing_line_trace, get_bouncing_line_traces, get_burst, get_burst_points, get_unit_index, get_chained_burst, fast_forward
 
 import math
+import numpy as np
 
 class EndlessSwordSpell(Spell):
     def on_init(self):
@@ -21,26 +22,17 @@ class EndlessSwordSpell(Spell):
         #TODO: Add description
         return "Descriptionn"
 
+    # Every metallic unit reached bursts again
     def get_impacted_tiles(self, x, y):
-        tiles = set()
-        closed = set()
+        level = self.caster.level
 
-        open = {self.caster}
+        links = np.zeros((level.width, level.height), dtype=bool)
+        for unit in get_unit_index(level).with_tag(Tags.Metallic):
+            links[unit.x, unit.y] = True
 
-        while open:
-            unit = open.pop()
-            closed.add(unit)
-
-            for stage in Burst(self.caster.level, Point(unit.x, unit.y), self.get_stat("radius")):
-                for point in stage:
-                    tiles.add(point)
-                    found_unit = self.caster.level.get_unit_at(point.x, point.y)
-
-                    if found_unit and Tags.Metallic in found_unit.tags and found_unit not in closed:
-                        open.add(found_unit)
-        
-        return list(tiles)
+        return list(get_chained_burst(level, Point(self.caster.x, self.caster.y), self.get_stat("radius"), links))
 
+    @fast_forward
     def cast(self, x, y):
         tiles = self.get_impacted_tiles(x, y)
         for point in tiles:
@@ -68,20 +60,36 @@ class RipplingSwordSpell(Spell):
 
     def get_impacted_tiles(self, x, y):
         angle = math.atan2(y - self.caster.y, x - self.caster.x)
-        tiles = get_bouncing_line(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length'), True)
-        endpoints = get_bouncing_line_endpoints(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length'))
+        line = get_bouncing_line_trace(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length'))
+        tiles = line.get_tiles(True)
 
-        if len(endpoints) > 2:
-            for point in endpoints[1:-1]:
-                for stage in Burst(self.caster.level, point, self.get_stat('radius')):
-                    for point in stage:
-                        tiles.append(point)
+        for point in line.get_bounces():
+            for stage in get_burst(self.caster.level, point, self.get_stat('radius')):
+                for point in stage:
+                    tiles.append(point)
 
         return list(filter(lambda point: point.x != self.caster.x or point.y != self.caster.y, tiles))
+
+    # Same tiles as get_impacted_tiles, with the lines for every target traced together
+    def get_heatmap(self, weights, castable):
+        scores = np.full(weights.shape, -1.0)
+        targets = list(zip(*np.nonzero(castable)))
+        angles = [math.atan2(y - self.caster.y, x - self.caster.x) for x, y in targets]
+        lines = get_bouncing_line_traces(self.caster.level, Point(self.caster.x, self.caster.y), angles, self.get_stat('length'))
+
+        for (x, y), line in zip(targets, lines):
+            tiles = list(line.tiles)
+            for point in line.get_bounces():
+                tiles.extend(get_burst_points(self.caster.level, point, self.get_stat('radius')))
+
+            scores[x, y] = sum(weights[point.x, point.y] for point in tiles if point.x != self.caster.x or point.y != self.caster.y)
+
+        return scores
     
+    @fast_forward
     def cast(self, x, y):
         angle = math.atan2(y - self.caster.y, x - self.caster.x)
-        endpoints = get_bouncing_line_endpoints(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length'))
+        endpoints = get_bouncing_line_trace(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length')).endpoints
 
         for i in range(len(endpoints) - 1):
             first = endpoints[i]
@@ -96,7 +104,7 @@ class RipplingSwordSpell(Spell):
             if i == len(endpoints) - 2:
                 break
 
-            for stage in Burst(self.caster.level, second, self.get_stat('radius')):
+            for stage in get_burst(self.caster.level, second, self.get_stat('radius')):
                 for point in stage:
                     if point.x == self.caster.x and point.y == self.caster.y:
                         continue
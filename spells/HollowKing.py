@@ -1,12 +1,13 @@
 from Spells import Spell, all_player_spell_constructors
-from Level import EventOnSpellCast, EventOnPreDamaged, Tags, Burst, Point, Buff, are_hostile, distance
+from Level import EventOnSpellCast, EventOnPreDamaged, Tags, Point, Buff, are_hostile, distance
 from CommonContent import FireCloud, BlizzardCloud, StormCloud
 
 from Level import BUFF_TYPE_BLESS, STACK_NONE
 
-from mods.Cradle.Pure import PureBuff, pure_desc, pure_unaffected, mana_cloud_desc, PureCloud
-from mods.Cradle.Util import get_perp_point, has_adjacent_wall, get_bouncing_line, get_bouncing_line_endpoints
+from mods.Cradle.Pure import purify, pure_desc, pure_unaffected, mana_cloud_desc, get_cloud_placements
+from mods.Cradle.Util import get_perp_point, has_adjacent_wall, get_bouncing_line_trace, get_bouncing_line_traces, get_burst, get_burst_points, get_multi_burst, SpellPlan, get_spell_plan, deal_area_damage, fast_forward, CastFrames, get_burst_heatmap, get_impacted_heatmap, get_units_in_los, get_unit_index
 import math
+import numpy as np
 
 class MadraPulseSpell(Spell):
     def on_init(self):
@@ -35,55 +36,56 @@ class MadraPulseSpell(Spell):
     # Categorize reflected points by distance from the wall
     # This gives a nicer animation
     def get_reflect_dict(self, reflect_points):
-        damage_points = {}
-        for point in reflect_points:
-            for i, stage in enumerate(Burst(self.caster.level, point, self.get_stat("reflection"))):
-                for point in stage:
-                    damage_points[point] = min(i, damage_points.get(point, i))
-        
-        return damage_points
+        return get_multi_burst(self.caster.level, reflect_points, self.get_stat("reflection"))
 
-    def get_impacted_tiles(self, x, y):
-        points = set([p for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')) for p in stage])
-        if self.get_stat("reflection"):
-            reflect_points = filter(lambda p: has_adjacent_wall(self.caster.level, p.x, p.y), points)
-            reflect_dict = self.get_reflect_dict(reflect_points)
-            points = points.union(set(reflect_dict.keys()))
+    def get_plan(self, x, y):
+        def build():
+            stages = get_burst(self.caster.level, Point(x, y), self.get_stat("radius"))
+            reflections = {}
+            if self.get_stat("reflection"):
+                reflect_points = [point for stage in stages for point in stage if has_adjacent_wall(self.caster.level, point.x, point.y)]
+                reflections = self.get_reflect_dict(reflect_points)
 
-        points.remove(Point(x, y))
+            points = set(point for stage in stages for point in stage)
+            points.update(reflections.keys())
+            points.remove(Point(x, y))
 
-        return list(points)
+            return SpellPlan(points, stages, reflections=tuple(reflections.items()))
 
-    def damage_point(self, x, y):
-        if self.caster.x == x and self.caster.y == y:
-            return
+        return get_spell_plan(self, x, y, (self.get_stat("radius"), self.get_stat("reflection")), build)
 
-        unit = self.caster.level.get_unit_at(x, y)
-        if unit:
-            unit.apply_buff(PureBuff(), self.get_stat("duration"))
+    def get_impacted_tiles(self, x, y):
+        return list(self.get_plan(x, y).tiles)
 
-        self.caster.level.deal_damage(x, y, self.get_stat("damage"), Tags.Pure, self)
+    def damage_points(self, points):
+        caster = Point(self.caster.x, self.caster.y)
+        points = [point for point in points if point != caster]
+        duration = self.get_stat("duration")
+        deal_area_damage(self.caster.level, points, self.get_stat("damage"), Tags.Pure, self,
+                         before_hit=lambda unit: purify(unit, duration))
 
+    @fast_forward
     def cast(self, x, y):
-        reflect_points = []
-        for stage in Burst(self.caster.level, Point(x, y), self.get_stat("radius")):
-            for point in stage:
-                self.damage_point(point.x, point.y)
-                if has_adjacent_wall(self.caster.level, point.x, point.y):
-                    reflect_points.append(point)
+        plan = self.get_plan(x, y)
+        frames = CastFrames(len(plan.stages) + len(set(i for _, i in plan.reflections)))
 
-            yield
+        for stage in plan.stages:
+            self.damage_points(stage)
+            yield from frames.tick()
         
         if not self.get_stat("reflection"):
             return
         
-        damage_points = sorted(self.get_reflect_dict(reflect_points).items(), key=lambda x: x[1])
         previous = None
-        for point, i in damage_points:
+        points = []
+        for point, i in plan.reflections:
             if previous != i:
-                yield
+                self.damage_points(points)
+                points = []
+                yield from frames.tick()
                 previous = i
-            self.damage_point(point.x, point.y)
+            points.append(point)
+        self.damage_points(points)
 
 class HollowSpearSpell(Spell):
     def __init__(self):
@@ -144,40 +146,50 @@ class HollowSpearSpell(Spell):
         self.requires_los = False if self.get_stat("barrage") else True
         return Spell.can_cast(self, x, y)
 
+    # Each line ends in a burst, stored in the plan as bursts[i]
+    def get_plan(self, x, y):
+        def build():
+            if self.get_stat("barrage"):
+                lines = self.get_barrage_lines(x, y)
+            else:
+                lines = [self.caster.level.get_points_in_line(Point(self.caster.x, self.caster.y), Point(x, y))]
+
+            lines = [tuple(line) for line in lines if line]
+            bursts = tuple(get_burst(self.caster.level, line[-1], self.get_stat("radius")) for line in lines)
+
+            if self.get_stat("barrage"):
+                tiles = [point for burst in bursts for stage in burst for point in stage]
+            else:
+                tiles = get_burst_points(self.caster.level, Point(x, y), self.get_stat('radius'))
+
+            return SpellPlan(tiles, lines=tuple(lines), bursts=bursts)
+
+        return get_spell_plan(self, x, y, (self.get_stat("radius"), self.get_stat("barrage")), build)
+
     def get_impacted_tiles(self, x, y):
-        if self.get_stat("barrage"):
-            lines = self.get_barrage_lines(x, y)
+        return list(self.get_plan(x, y).tiles)
 
-            tiles = []
-            for line in lines:
-                tiles.extend([p for stage in Burst(self.caster.level, line[-1], self.get_stat("radius")) for p in stage])
-            
-            return tiles
-        else:
-            return [p for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')) for p in stage]
+    def get_heatmap(self, weights, castable):
+        if self.get_stat("barrage"):
+            return get_impacted_heatmap(self, weights, castable)
+        return get_burst_heatmap(self.caster.level, weights, castable, self.get_stat("radius"))
 
     def thunder_damage_point(self, point):
-        los_units = self.caster.level.get_units_in_los(point)
-        for unit in los_units:
-            if unit.x == point.x and unit.y == point.y:
-                continue
-            if distance(point, Point(unit.x, unit.y)) > self.thunder_radius:
-                continue
-            if not are_hostile(self.caster, unit):
-                continue
-                
+        targets = [unit for unit in get_unit_index(self.caster.level).near(point, self.thunder_radius)
+                   if (unit.x, unit.y) != (point.x, point.y) and are_hostile(self.caster, unit)
+                   and distance(point, Point(unit.x, unit.y)) <= self.thunder_radius]
+
+        for unit in get_units_in_los(self.caster.level, point, targets):
             line = self.caster.level.get_points_in_line(point, Point(unit.x, unit.y))
             for line_point in line:
                 self.caster.level.show_effect(line_point.x, line_point.y, Tags.Lightning, minor=True)
             
             unit.deal_damage(self.thunder_damage, Tags.Lightning, self)
         
+    @fast_forward
     def cast(self, x, y):
-        lines = []
-        if self.get_stat("barrage"):
-            lines = self.get_barrage_lines(x, y)
-        else:
-            lines.append(self.caster.level.get_points_in_line(Point(self.caster.x, self.caster.y), Point(x, y)))
+        plan = self.get_plan(x, y)
+        lines = plan.lines
 
         if not lines:
             return
@@ -185,7 +197,7 @@ class HollowSpearSpell(Spell):
         max_len = max([len(line) for line in lines])
 
         for i in range(max_len):
-            for line in lines:
+            for line, burst in zip(lines, plan.bursts):
                 if i >= len(line):
                     continue
                 
@@ -194,16 +206,14 @@ class HollowSpearSpell(Spell):
                 self.caster.level.show_effect(point.x, point.y, Tags.Pure, minor=True)
 
                 if i == len(line) - 1:
-                    for stage in Burst(self.caster.level, point, self.get_stat("radius")):
-                        for p in stage:
-                            unit = self.caster.level.get_unit_at(p.x, p.y)
-                            if self.get_stat("thunder_spear") and unit:
-                                self.thunder_damage_point(p)
-                                
-                            self.caster.level.deal_damage(p.x, p.y, self.get_stat("damage"), Tags.Pure, self)
-                            
-                            if unit:
-                                unit.apply_buff(PureBuff(), self.get_stat("duration"))
+                    before_hit = None
+                    if self.get_stat("thunder_spear"):
+                        before_hit = lambda unit: self.thunder_damage_point(Point(unit.x, unit.y))
+                    duration = self.get_stat("duration")
+
+                    for stage in burst:
+                        deal_area_damage(self.caster.level, stage, self.get_stat("damage"), Tags.Pure, self,
+                                         before_hit=before_hit, after_hit=lambda unit: purify(unit, duration))
             yield
             
 
@@ -242,19 +252,19 @@ class StarSpell(Spell):
         self.damage = self.seven_stars.get_stat("damage")
         self.radius = self.seven_stars.get_stat("radius")
     
+    @fast_forward(get_level=lambda spell: spell.seven_stars.caster.level)
     def cast(self, x, y):
         # Not sure why, but self.caster isn't being set
         # So use the seven_stars spell's caster for the level
         caster = self.seven_stars.caster
         level = caster.level
 
-        for stage in Burst(level, Point(x, y), self.radius):
-            for point in stage:
-                level.deal_damage(point.x, point.y, self.damage, Tags.Pure, self)
-                unit = level.get_unit_at(point.x, point.y)
+        def after_hit(unit):
+            if unit.is_alive():
+                purify(unit, 5)
 
-                if unit is not None:
-                    unit.apply_buff(PureBuff(), 5)
+        for stage in get_burst(level, Point(x, y), self.radius):
+            deal_area_damage(level, stage, self.damage, Tags.Pure, self, after_hit=after_hit)
             yield
 
             if self.seven_stars.get_stat("burning"):
@@ -300,7 +310,10 @@ class SevenStarsSpell(Spell):
                 + pure_desc).format(**self.fmt_dict())
 
     def get_impacted_tiles(self, x, y):
-        return [p for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')) for p in stage]
+        return get_burst_points(self.caster.level, Point(x, y), self.get_stat('radius'))
+
+    def get_heatmap(self, weights, castable):
+        return get_burst_heatmap(self.caster.level, weights, castable, self.get_stat('radius'))
 
     def cast_instant(self, x, y):
         buff = SevenStarsBuff(Point(x, y), self)
@@ -384,28 +397,24 @@ class SwordOfJudgment(Spell):
         return ("Deals [{damage}_damage:pure] to the target.\n"
                 "Your summoned holy units within line of sight deal [{holy_damage}_damage:holy] to the target.").format(**self.fmt_dict())
 
+    @fast_forward
     def cast(self, x, y):
         holy_points = []
 
-        for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')):
-            for point in stage:
-                unit = self.caster.level.get_unit_at(point.x, point.y)
-                if unit is not None:
-                    holy_points.append(Point(unit.x, unit.y))
-
-                self.caster.level.deal_damage(point.x, point.y, self.get_stat('damage'), Tags.Pure, self)
+        for stage in get_burst(self.caster.level, Point(x, y), self.get_stat('radius')):
+            deal_area_damage(self.caster.level, stage, self.get_stat('damage'), Tags.Pure, self,
+                             before_hit=lambda unit: holy_points.append(Point(unit.x, unit.y)))
 
         yield
 
+        holy_units = [unit for unit in get_unit_index(self.caster.level).with_tag(Tags.Holy) if not are_hostile(self.caster, unit)]
+        holy_units = get_units_in_los(self.caster.level, Point(x, y), holy_units)
+
         for point in holy_points:
-            los_units = self.caster.level.get_units_in_los(Point(x, y))
+            # Holy units killed by the beams at an earlier point no longer fire
+            holy_units = [unit for unit in holy_units if unit.is_alive()]
 
-            for los_unit in los_units:
-                if are_hostile(self.caster, los_unit):
-                    continue
-                if not Tags.Holy in los_unit.tags:
-                    continue
-                
+            for los_unit in holy_units:
                 line = self.caster.level.get_points_in_line(Point(los_unit.x, los_unit.y), point)
 
                 if self.get_stat("web_of_light"):
@@ -451,36 +460,55 @@ class ManaBulletSpell(Spell):
     
     def get_bounce_results(self, x, y):
         angle = math.atan2(y - self.caster.y, x - self.caster.x)
-        points = get_bouncing_line(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat("length"), True)
-        endpoints = get_bouncing_line_endpoints(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat('length'))
+        line = get_bouncing_line_trace(self.caster.level, Point(self.caster.x, self.caster.y), angle, self.get_stat("length"))
+
+        return line.get_tiles(True), line.get_bounces()
+
+    # Bounce points map to the burst of clouds they release
+    def get_plan(self, x, y):
+        def build():
+            points, endpoints = self.get_bounce_results(x, y)
+            bursts = {point: get_burst(self.caster.level, point, self.get_stat('radius')) for point in endpoints}
+            return SpellPlan(points, bursts=bursts)
 
-        if len(endpoints) > 2:
-            return points, endpoints[1:-1]
-        else:
-            return points, []
+        return get_spell_plan(self, x, y, (self.get_stat("length"), self.get_stat("radius")), build)
 
     def get_impacted_tiles(self, x, y):
-        return self.get_bounce_results(x, y)[0]
+        return list(self.get_plan(x, y).tiles)
+
+    # The bullet hits a tile every time it passes through it
+    def get_heatmap(self, weights, castable):
+        scores = np.full(weights.shape, -1.0)
+        targets = list(zip(*np.nonzero(castable)))
+        angles = [math.atan2(y - self.caster.y, x - self.caster.x) for x, y in targets]
+        lines = get_bouncing_line_traces(self.caster.level, Point(self.caster.x, self.caster.y), angles, self.get_stat("length"))
+
+        for (x, y), line in zip(targets, lines):
+            points = [point for point in line.tiles if point.x != self.caster.x or point.y != self.caster.y]
+            scores[x, y] = sum(weights[point.x, point.y] for point in points)
+
+        return scores
     
+    # Overlapping bursts at different bounces share their clouds, which are placed once the bullet stops
+    @fast_forward
     def cast(self, x, y):
-        points, endpoints = self.get_bounce_results(x, y)
-        for point in points:
+        plan = self.get_plan(x, y)
+        placements = get_cloud_placements(self.caster.level)
+        for point in plan.tiles:
             if self.caster.x == point.x and self.caster.y == point.y:
                 continue
 
             self.caster.level.deal_damage(point.x, point.y, self.get_stat('damage'), Tags.Pure, self)
             yield
 
-            if not point in endpoints:
+            if not point in plan.bursts:
                 continue
 
-            for stage in Burst(self.caster.level, point, self.get_stat('radius')):
+            for stage in plan.bursts[point]:
                 for burst_point in stage:
-                    tile = self.caster.level.tiles[burst_point.x][burst_point.y]
-                    if tile.cloud is not None:
-                        tile.cloud.kill()
-                    cloud = PureCloud(self.caster, self.get_stat('duration'))
-                    self.caster.level.add_obj(cloud, burst_point.x, burst_point.y)
+                    placements.add(burst_point.x, burst_point.y, self.caster, self.get_stat('duration'))
+
+        placements.commit()
 
 all_player_spell_constructors.append(MadraPulseSpell)
 all_player_spell_constructors.append(HollowSpearSpell)
@@ -1,5 +1,5 @@
 from Spells import InfernoCloud, Spell, all_player_spell_constructors
-from Level import Tags, Burst, Point, Buff, are_hostile, EventOnDamaged, Unit
+from Level import Tags, Point, Buff, are_hostile, EventOnDamaged, Unit
 from CommonContent import BlizzardCloud, FireCloud, Poison, SimpleMeleeAttack, StormCloud, apply_minion_bonuses
 from Monsters import Bloodghast, Ghost, GhostFire, GhostKing, GhostMass
 import random
@@ -7,8 +7,8 @@ import math
 
 from Level import BUFF_TYPE_BLESS, STACK_NONE
 
-from mods.Cradle.Pure import PureCloud, PureBuff, pure_desc, mana_cloud_desc
-from mods.Cradle.Util import get_perp_point_slope
+from mods.Cradle.Pure import PureCloud, purify, make_pure_cloud, pure_desc, mana_cloud_desc, is_purified, get_cloud_placements, CLOUD_REPLACE_OTHER
+from mods.Cradle.Util import get_perp_point_slope, get_burst, get_burst_points, get_multi_burst, SpellPlan, get_spell_plan, get_nearest_tiles, get_burst_area, get_unit_index, fast_forward, CastFrames
 
 class HollowDomainSpell(Spell):
     def __init__(self):
@@ -39,12 +39,14 @@ class HollowDomainSpell(Spell):
                 + mana_cloud_desc).format(**self.fmt_dict())
     
     def get_impacted_tiles(self, x, y):
-        return [p for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')) for p in stage]
+        return get_burst_points(self.caster.level, Point(x, y), self.get_stat('radius'))
 
+    @fast_forward
     def cast(self, x, y):
         tiles = self.get_impacted_tiles(x, y)
+        frames = CastFrames(len(tiles), per_frame=8)
 
-        for i, point in enumerate(tiles):
+        for point in tiles:
             tile = self.caster.level.tiles[point.x][point.y]
             if tile.cloud is not None:
                 if self.get_stat("overload"):
@@ -57,18 +59,16 @@ class HollowDomainSpell(Spell):
                         damage_type = Tags.Lightning
                     
                     if damage_type is not None:
-                        for stage in Burst(self.caster.level, tile, self.get_stat("overload")):
+                        for stage in get_burst(self.caster.level, tile, self.get_stat("overload")):
                             for burst_point in stage:
                                 self.caster.level.deal_damage(burst_point.x, burst_point.y, self.overload_damage, damage_type, self)
-                        yield
                 
                 tile.cloud.kill()
 
-            cloud = PureCloud(self.caster, self.get_stat("duration"), self.get_stat("healing"))
+            cloud = make_pure_cloud(self.caster.level, self.caster, self.get_stat("duration"), self.get_stat("healing"))
             self.caster.level.add_obj(cloud, point.x, point.y)
             
-            if i % 8 == 0:  
-                yield
+            yield from frames.tick()
 
 class SoulCloakBuff(Buff):
     def __init__(self, radius, resonance_radius):
@@ -90,31 +90,34 @@ class SoulCloakBuff(Buff):
 
         return None
 
-    def resonance_burst(self, attack, enemy):
-        for stage in Burst(self.owner.level, Point(enemy.x, enemy.y), self.resonance_radius):
-            for point in stage:
-                unit = self.owner.level.get_unit_at(point.x, point.y)
+    # The units a burst from the point would reach, in the order the burst reaches their tiles
+    def get_units_in_burst(self, point, radius):
+        area = get_burst_area(self.owner.level, point, radius)
+        units = [unit for unit in get_unit_index(self.owner.level).near(point, radius) if Point(unit.x, unit.y) in area]
+        units.sort(key=lambda unit: area[Point(unit.x, unit.y)])
+        return units
 
-                if unit is not None and are_hostile(self.owner, unit):
-                    unit.deal_damage(attack.get_stat("damage"), attack.damage_type, self)
+    def resonance_burst(self, attack, enemy):
+        for unit in self.get_units_in_burst(Point(enemy.x, enemy.y), self.resonance_radius):
+            # Units killed earlier in the burst are no longer on their tile
+            if not unit.is_alive():
+                continue
+            if are_hostile(self.owner, unit):
+                unit.deal_damage(attack.get_stat("damage"), attack.damage_type, self)
 
     def on_advance(self):
         attack = self.find_melee_attack(self.owner)
         if attack is None:
             return
         
-        for stage in Burst(self.owner.level, Point(self.owner.x, self.owner.y), self.radius):
-            for point in stage:
-                unit = self.owner.level.get_unit_at(point.x, point.y)
-
-                if unit is None:
-                    continue
-
-                if are_hostile(self.owner, unit):
-                    unit.deal_damage(attack.get_stat("damage"), attack.damage_type, self)
+        for unit in self.get_units_in_burst(Point(self.owner.x, self.owner.y), self.radius):
+            if not unit.is_alive():
+                continue
+            if are_hostile(self.owner, unit):
+                unit.deal_damage(attack.get_stat("damage"), attack.damage_type, self)
 
-                if self.resonance_radius is not None and unit.has_buff(PureBuff):
-                    self.resonance_burst(attack, unit)
+            if self.resonance_radius is not None and is_purified(unit):
+                self.resonance_burst(attack, unit)
 
 class SoulCloakSpell(Spell):
     def on_init(self):
@@ -140,7 +143,7 @@ class SoulCloakSpell(Spell):
                 "Lasts [{duration}_turns:duration].\n").format(**self.fmt_dict())
 
     def get_impacted_tiles(self, x, y):
-        return [p for stage in Burst(self.caster.level, Point(x, y), self.get_stat('radius')) for p in stage]
+        return get_burst_points(self.caster.level, Point(x, y), self.get_stat('radius'))
 
     def can_cast(self, x, y):
         unit = self.caster.level.get_unit_at(x, y)
@@ -202,13 +205,13 @@ class EmptyPalmSpell(Spell):
         for tile in tiles:
             unit = self.caster.level.get_unit_at(tile.x, tile.y)
             if unit is not None:
-                if self.get_stat('empty echo') and unit.has_buff(PureBuff):
+                if self.get_stat('empty echo') and is_purified(unit):
                     ghost = Ghost()
                     ghost.turns_to_death = 14
                     apply_minion_bonuses(self, ghost)
                     self.summon(ghost, Point(x, y))
                 
-                unit.apply_buff(PureBuff(), self.get_stat("duration"))
+                purify(unit, self.get_stat("duration"))
             
             self.caster.level.deal_damage(tile.x, tile.y, self.get_stat("damage"), Tags.Pure, self)
 
@@ -233,34 +236,41 @@ class WordOfEmptiness(Spell):
                 "Mana clouds last [4_turns:duration].\n"
                 + mana_cloud_desc).format(**self.fmt_dict())
     
-    def get_impacted_tiles(self, x, y):
-        tiles = set()
-        for unit in self.caster.level.units:
-            if not are_hostile(self.caster, unit):
-                continue
+    def get_enemies(self):
+        return get_unit_index(self.caster.level).hostiles(self.caster)
 
-            for stage in Burst(self.caster.level, Point(unit.x, unit.y), self.get_stat("radius")):
-                for p in stage:
-                    tiles.add(p)
-        
-        return list(tiles)
+    def get_impacted_tiles(self, x, y):
+        return list(get_multi_burst(self.caster.level, self.get_enemies(), self.get_stat("radius")))
 
+    @fast_forward
     def cast(self, x, y):
         self.caster.xp += 100
-        for unit in self.caster.level.units:
-            if not are_hostile(self.caster, unit):
-                continue
-
-            unit.apply_buff(PureBuff(), self.get_stat("duration"))
-            
-            for stage in Burst(self.caster.level, Point(unit.x, unit.y), self.get_stat("radius")):
+        enemies = self.get_enemies()
+        placements = get_cloud_placements(self.caster.level)
+        frames = CastFrames(len(enemies))
+
+        # A cloud would only be replaced by the next enemy whose burst covers it, so each point is left to the last one
+        covered = set()
+        clouds = []
+        for unit in reversed(enemies):
+            points = []
+            for stage in get_burst(self.caster.level, Point(unit.x, unit.y), self.get_stat("radius")):
                 for point in stage:
-                    tile = self.caster.level.tiles[point.x][point.y]
-                    if tile.cloud is not None:
-                        tile.cloud.kill()
-                    cloud = PureCloud(self.caster, 4, 0)
-                    self.caster.level.add_obj(cloud, point.x, point.y)
-            yield
+                    if point not in covered:
+                        covered.add(point)
+                        points.append(point)
+            clouds.append(points)
+        clouds.reverse()
+
+        # Each enemy is purified and then covered, one after another
+        for unit, points in zip(enemies, clouds):
+            purify(unit, self.get_stat("duration"))
+
+            for point in points:
+                placements.add(point.x, point.y, self.caster, 4, 0)
+
+            placements.commit()
+            yield from frames.tick()
 
 class Shred(Spell):
     def on_init(self):
@@ -268,27 +278,17 @@ class Shred(Spell):
         self.description = "Desc"
     
     def spawn_clouds(self):
-        clouds_left = self.get_stat("cloud_count")
-        for stage in Burst(self.caster.level, Point(self.caster.x, self.caster.y), self.caster.level.width):
-            for point in stage:
-                if point.x == self.caster.x and point.y == self.caster.y:
-                    continue
+        placements = get_cloud_placements(self.caster.level)
+        points = get_nearest_tiles(self.caster.level, Point(self.caster.x, self.caster.y), self.get_stat("cloud_count"), placements.get_blocked())
 
-                tile = self.caster.level.tiles[point.x][point.y]
-                if tile.cloud is not None:
-                    if isinstance(tile.cloud, PureCloud):
-                        continue
-                    tile.cloud.kill()
-                
-                cloud = PureCloud(self.caster.source.caster, self.get_stat("duration"), 0)
-                self.caster.level.add_obj(cloud, point.x, point.y)
-                clouds_left -= 1
+        for point in points:
+            placements.add(point.x, point.y, self.caster.source.caster, self.get_stat("duration"), 0, CLOUD_REPLACE_OTHER)
 
-                if clouds_left < 1:
-                    return
+        placements.commit()
 
+    @fast_forward
     def cast(self, x, y):
-        for stage in Burst(self.caster.level, Point(self.caster.x, self.caster.y), self.get_stat("radius")):
+        for stage in get_burst(self.caster.level, Point(self.caster.x, self.caster.y), self.get_stat("radius")):
             for point in stage:
                 unit = self.caster.level.get_unit_at(point.x, point.y)
                 if unit is None:
@@ -428,11 +428,19 @@ class HelixBeam(Spell):
         
         return helix
 
+    def get_plan(self, x, y):
+        def build():
+            point_sets = self.get_point_sets(x, y)
+            return SpellPlan([point for point_set in point_sets for point in point_set], point_sets)
+
+        return get_spell_plan(self, x, y, (), build)
+
     def get_impacted_tiles(self, x, y):
-        return [point for point_set in self.get_point_sets(x, y) for point in point_set]
+        return list(self.get_plan(x, y).tiles)
 
+    @fast_forward
     def cast(self, x, y):
-        point_sets = self.get_point_sets(x, y)
+        point_sets = self.get_plan(x, y).stages
         for point_set in point_sets:
             if self.caster.level.is_point_in_bounds(point_set[0]):
                 self.caster.level.deal_damage(point_set[0].x, point_set[0].y, self.get_stat("damage"), Tags.Pure, self)